@@ -10,14 +10,17 @@
 const char* ssid = "";
 const char* password = "";
 
+// Unique name for this genset (shown in the dashboard fleet view)
+#define DEVICE_ID "default"
+
 // API endpoints
 #define USE_LOCAL_API 0
 #if USE_LOCAL_API
 const char* api_server_url_data = "http://192.168.100.14:5000/api/sensor-data";
-const char* api_server_url_cmds = "http://192.168.100.14:5000/api/commands";
+const char* api_server_url_cmds = "http://192.168.100.14:5000/api/commands?device_id=" DEVICE_ID;
 #else
 const char* api_server_url_data = "https://genset-monitoring.onrender.com/api/sensor-data";
-const char* api_server_url_cmds = "https://genset-monitoring.onrender.com/api/commands";
+const char* api_server_url_cmds = "https://genset-monitoring.onrender.com/api/commands?device_id=" DEVICE_ID;
 #endif
 
 // Sensor Pins
@@ -146,7 +149,7 @@ void pushToApiServer(float temp, int fuel) {
     http.begin(api_server_url_data);
     http.addHeader("Content-Type", "application/json");
 
-    String payload = "{\"temperature\":" + String(temp) + ",\"fuel_level\":" + String(fuel) + "}";
+    String payload = "{\"device_id\":\"" DEVICE_ID "\",\"temperature\":" + String(temp) + ",\"fuel_level\":" + String(fuel) + "}";
     Serial.print("Sending payload: ");
     Serial.println(payload);
 
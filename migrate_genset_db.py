@@ -1,33 +1,114 @@
-import sqlite3
+#!/usr/bin/env python3
+"""
+Apply pending schema migrations to the genset database.
+
+Safe to run against a live database: large tables are copied in chunks while
+the API server keeps ingesting, and the final swap is a short transaction.
+
+With --import-from, readings from a single-file database are copied into the
+configured STORAGE_BACKEND (e.g. partitioned) in chunks. Rows already present
+are skipped, so an interrupted import can simply be run again.
+
+Usage:
+    python migrate_genset_db.py [--db PATH] [--chunk-size 5000]
+    python migrate_genset_db.py --status
+    STORAGE_BACKEND=partitioned python migrate_genset_db.py --import-from data/genset_monitoring.db
+"""
+
+import argparse
+import logging
 import os
 
-DB_PATH = os.path.join("data", "genset_monitoring.db")
+from src.config import DATABASE_PATH
+from src.utils.migrations import (
+    DEFAULT_CHUNK_SIZE, LATEST_VERSION, MIGRATIONS, connect, get_schema_version, run_migrations,
+)
+from src.utils.storage import get_storage
+
+
+def show_progress(label, copied, total):
+    percent = 100.0 * copied / total if total else 100.0
+    print(f"\r  {label}: {copied}/{total} rows ({percent:.1f}%)", end="", flush=True)
+    if copied >= total:
+        print()
+
+
+def print_progress(version, copied, total):
+    show_progress(f"v{version}", copied, total)
+
+
+def import_readings(source, storage, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """Copy every reading of ``source`` into ``storage``, ``chunk_size`` rows at a time."""
+    conn = connect(source)
+    try:
+        total = conn.execute("SELECT COUNT(*) FROM sensor_data").fetchone()[0]
+        copied = 0
+        last_rowid = 0
+        while True:
+            rows = conn.execute('''
+                SELECT rowid, device_id, timestamp, temperature, fuel_level
+                FROM sensor_data WHERE rowid > ? ORDER BY rowid LIMIT ?
+            ''', (last_rowid, chunk_size)).fetchall()
+            if not rows:
+                break
+            storage.ingest_many(row[1:] for row in rows)
+            last_rowid = rows[-1][0]
+            copied += len(rows)
+            if progress:
+                progress(copied, max(total, copied))
+        return copied
+    finally:
+        conn.close()
+
 
-conn = sqlite3.connect(DB_PATH)
-c = conn.cursor()
+def main():
+    parser = argparse.ArgumentParser(description="Apply genset database schema migrations")
+    parser.add_argument("--db", default=DATABASE_PATH,
+                        help="Path to the SQLite database (default: DATABASE_PATH from src/config.py)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="Rows copied per transaction when rebuilding tables or importing")
+    parser.add_argument("--target", type=int, default=None, help="Schema version to migrate to")
+    parser.add_argument("--status", action="store_true", help="Show schema version and exit")
+    parser.add_argument("--import-from", metavar="PATH",
+                        help="Copy readings from this single-file database into STORAGE_BACKEND")
+    args = parser.parse_args()
 
-# 1. Create a new table with the correct schema
-c.execute('''
-    CREATE TABLE IF NOT EXISTS sensor_data_new (
-        timestamp TEXT PRIMARY KEY,
-        fuel_level REAL,
-        temperature REAL
-    )
-''')
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# 2. Copy relevant data from the old table
-c.execute('''
-    INSERT OR IGNORE INTO sensor_data_new (timestamp, fuel_level, temperature)
-    SELECT timestamp, fuel_level, temperature FROM sensor_data
-''')
+    if args.import_from:
+        if not os.path.exists(args.import_from):
+            parser.error(f"{args.import_from} does not exist")
+        storage = get_storage()
+        if os.path.abspath(getattr(storage, "path", "")) == os.path.abspath(args.import_from):
+            parser.error(f"{args.import_from} is already the {storage.name} storage database")
+        conn = connect(args.import_from)
+        source_version = get_schema_version(conn)
+        conn.close()
+        if source_version < LATEST_VERSION:
+            parser.error(f"{args.import_from} is at schema version {source_version}; "
+                         f"migrate it first with --db {args.import_from}")
+        storage.init()
+        print(f"Importing {args.import_from} into {storage.name} storage")
+        copied = import_readings(args.import_from, storage, args.chunk_size,
+                                 progress=lambda copied, total: show_progress("import", copied, total))
+        print(f"Import complete: {copied} rows read.")
+        return
 
-conn.commit()
+    conn = connect(args.db)
+    current = get_schema_version(conn)
+    conn.close()
+    print(f"Database: {args.db}")
+    print(f"Schema version: {current} (latest: {LATEST_VERSION})")
+    if args.status:
+        for migration in MIGRATIONS:
+            state = "applied" if migration.version <= current else "pending"
+            print(f"  [{state}] {migration.version}: {migration.description}")
+        return
 
-# 3. Drop the old table and rename the new one
-c.execute('DROP TABLE sensor_data')
-c.execute('ALTER TABLE sensor_data_new RENAME TO sensor_data')
-conn.commit()
+    version = run_migrations(args.db, target=args.target, chunk_size=args.chunk_size,
+                             progress=print_progress)
+    print(f"Migration complete. Schema version is now {version}.")
 
-print("Migration complete. Only timestamp, fuel_level, and temperature are now in sensor_data.")
 
-conn.close() 
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Delete sensor readings older than a retention window.
+
+With STORAGE_BACKEND=partitioned whole partition files are dropped; with the
+single-file SQLite backend rows are deleted in small batches.
+
+Usage:
+    python prune_genset_db.py --days 365
+"""
+
+import argparse
+import logging
+from datetime import datetime, timedelta
+
+from src.utils.storage import get_storage
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete genset sensor data older than N days")
+    parser.add_argument("--days", type=int, required=True, help="Days of history to keep")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    storage = get_storage()
+    storage.init()
+    cutoff = datetime.now() - timedelta(days=args.days)
+    print(f"Pruning {storage.name} storage before {cutoff:%Y-%m-%d %H:%M:%S}")
+    print(f"Done: {storage.drop_before(cutoff)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,22 +4,59 @@ API Server for ESP32 Genset Monitoring
 Provides HTTP endpoints for ESP32 to send sensor data and receive commands
 """
 
+import gzip
 import json
-import sqlite3
 import logging
+import math
 import os
-from datetime import datetime
-from flask import Flask, request, jsonify
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from flask import Flask, g, request, jsonify
 from flask_cors import CORS
 
-from src.utils.database import init_database, insert_sensor_data, get_latest_data
+try:
+    import brotli  # Optional: preferred over gzip when the client accepts br
+except ImportError:
+    brotli = None
 
-# Define DB_FILE for database path
-DB_FILE = os.environ.get("DATABASE_PATH", os.path.join(os.getcwd(), "logs", "genset_data.db"))
+from src.config import (
+    DEFAULT_DEVICE_ID, THRESHOLDS, FLEET_WINDOW_HOURS, FLEET_CACHE_TTL, FLEET_PAGE_SIZE,
+    COMPRESS_MIN_SIZE, HISTORY_MAX_LIMIT, DATABASE_PATH, INGEST_RATE_PER_DEVICE, INGEST_BURST,
+    TEMPERATURE_RANGE, FUEL_LEVEL_RANGE, ADMISSION_MAX_IN_FLIGHT, ADMISSION_SHARES,
+)
+from src.utils.admission import (
+    COMMAND, INGEST, READ, AdmissionController, DeviceRateLimiter, ValidationError,
+    validate_device_id, validate_sensor_payload,
+)
+from src.utils.storage import get_storage
+
+# Single source of truth for sensor readings (see STORAGE_BACKEND in src/config.py)
+DB_FILE = DATABASE_PATH
+storage = get_storage()
+
+# --- In-memory state for relay and buzzer commands, keyed by device_id ---
+relay_states = {}   # device_id -> False=OFF, True=ON
+buzzer_alerts = {}  # device_id -> True if AI alert should trigger buzzer
+
+# --- Ingest protection: per-device rate limits and priority load shedding ---
+rate_limiter = DeviceRateLimiter(INGEST_RATE_PER_DEVICE, INGEST_BURST)
+admission = AdmissionController(ADMISSION_MAX_IN_FLIGHT, ADMISSION_SHARES)
+
+# Endpoint -> request class; endpoints not listed (health, config) are never shed
+REQUEST_PRIORITIES = {
+    'get_commands': COMMAND,
+    'set_relay': COMMAND,
+    'set_buzzer': COMMAND,
+    'reset_buzzer': COMMAND,
+    'get_all_sensor_data_endpoint': READ,
+    'get_fleet': READ,
+    'get_status': READ,
+}
 
-# --- In-memory state for relay and buzzer commands ---
-relay_state = False  # False=OFF, True=ON
-buzzer_alert = False # True if AI alert should trigger buzzer
+# --- Short-lived cache for /api/fleet so many dashboards share one query ---
+_fleet_cache = {}  # (limit, offset) -> (expires_at, rows, total)
+_fleet_cache_lock = threading.Lock()  # app.run serves requests in threads
 
 # Ensure logs directory exists before configuring logging
 os.makedirs('logs', exist_ok=True)
@@ -36,47 +73,111 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+app.json.compact = True  # No indentation/spaces in JSON, even in debug mode
 CORS(app)  # Enable CORS for all routes
 
 # Initialize database
-init_database()
+storage.init()
 
-def get_all_sensor_data(limit: int = 100) -> list:
-    """Fetch up to 'limit' most recent sensor data records from the database."""
-    try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT timestamp, temperature, fuel_level
-            FROM sensor_data
-            ORDER BY timestamp DESC
-            LIMIT ?
-        """, (limit,))
-        rows = cursor.fetchall()
-        conn.close()
-        return [
-            {
-                'timestamp': row[0],
-                'temperature': row[1],
-                'fuel_level': row[2],
-            }
-            for row in rows
-        ]
-    except Exception as e:
-        logger.error(f"Error fetching all sensor data: {e}")
-        return []
+def get_device_id(payload: dict = None) -> str:
+    """
+    Device a request refers to: ?device_id=, then the JSON body, then the default.
+    Raises ``ValidationError`` (a 400, see ``invalid_request``) for unusable ids.
+    """
+    device_id = request.args.get('device_id')
+    if not device_id and isinstance(payload, dict):
+        device_id = payload.get('device_id')
+    return validate_device_id(str(device_id)) if device_id else DEFAULT_DEVICE_ID
+
+def evaluate_alerts(reading: dict) -> list:
+    """Return the names of the alert thresholds a reading breaches."""
+    alerts = []
+    fuel_level = reading.get('fuel_level')
+    temperature = reading.get('temperature')
+    if fuel_level is not None and fuel_level < THRESHOLDS['fuel_level']:
+        alerts.append('low_fuel')
+    if temperature is not None and temperature > THRESHOLDS['temperature']:
+        alerts.append('high_temperature')
+    return alerts
+
+def parse_db_timestamp(value: str):
+    """Convert a stored (local time) timestamp to an aware UTC datetime for HTTP headers."""
+    if not value:
+        return None
+    return datetime.strptime(value, "%Y-%m-%d %H:%M:%S").astimezone(timezone.utc)
+
+def not_modified(etag) -> bool:
+    """True if the client's If-None-Match copy is still current."""
+    return request.if_none_match.contains_weak(etag)
+
+def cacheable(response, last_modified=None, etag=None):
+    """
+    Let clients cache a read response but revalidate it on every poll.
+    ETags are weak: the same validator covers the gzip, brotli and identity bodies.
+    """
+    response.cache_control.no_cache = True
+    if last_modified:
+        response.last_modified = last_modified
+    if etag:
+        response.set_etag(etag, weak=True)
+    return response.make_conditional(request)
+
+@app.errorhandler(ValidationError)
+def invalid_request(e):
+    return jsonify({'error': str(e)}), 400
+
+@app.before_request
+def admit_request():
+    """Shed lower-priority requests first when too many are in flight."""
+    if request.endpoint == 'handle_sensor_data':
+        priority = INGEST if request.method == 'POST' else READ
+    else:
+        priority = REQUEST_PRIORITIES.get(request.endpoint)
+    if priority is None:
+        return None
+    if not admission.try_acquire(priority):
+        response = jsonify({'error': 'Server busy, try again shortly', 'class': priority})
+        response.headers['Retry-After'] = '1'
+        return response, 503
+    g.admitted = True
+    return None
+
+@app.teardown_request
+def release_request(exc=None):
+    if g.pop('admitted', False):
+        admission.release()
+
+@app.after_request
+def compress_response(response):
+    """Compress JSON responses with brotli or gzip when the client accepts it."""
+    if (response.status_code != 200 or response.direct_passthrough
+            or response.mimetype != 'application/json'
+            or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return response
+    accepted = request.accept_encodings
+    if brotli and accepted['br']:
+        response.set_data(brotli.compress(body, quality=4))
+        response.headers['Content-Encoding'] = 'br'
+    elif accepted['gzip']:
+        response.set_data(gzip.compress(body, compresslevel=5))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
 
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     try:
-        conn = sqlite3.connect(DB_FILE)
-        conn.close()
+        storage.ping()
         return jsonify({
             'status': 'healthy',
             'timestamp': datetime.now().isoformat(),
             'database': 'connected',
-            'database_path': DB_FILE
+            'database_path': DB_FILE,
+            'storage_backend': storage.name
         }), 200
     except Exception as e:
         logger.error(f"Health check failed: {e}")
@@ -90,12 +191,45 @@ def health_check():
 def get_all_sensor_data_endpoint():
     """
     Return up to 100 most recent sensor data records (for dashboard/history).
-    Optional query param: ?limit=50
+    Optional query params: ?limit=50&device_id=genset-1&format=columnar
+    and ?start=2025-07-01&end=2025-07-31 23:59:59 to restrict the time range.
+    limit is clamped to 1..HISTORY_MAX_LIMIT.
+
+    The columnar format returns {"ts": [...], "fuel": [...], "temp": [...]}
+    (plus "device" when no device_id is given) so clients can build a
+    DataFrame without one dict per row.
+
+    The ETag changes on every stored reading; Last-Modified only has
+    one-second resolution and is sent for clients without ETag support.
     """
     try:
-        limit = int(request.args.get('limit', 100))
-        data = get_all_sensor_data(limit=limit)
-        return jsonify({'data': data, 'count': len(data)}), 200
+        limit = max(1, min(int(request.args.get('limit', 100)), HISTORY_MAX_LIMIT))
+        device_id = request.args.get('device_id')
+        if device_id:
+            validate_device_id(device_id)
+        start = request.args.get('start')
+        end = request.args.get('end')
+        start = datetime.fromisoformat(start) if start else None
+        end = datetime.fromisoformat(end) if end else None
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+    try:
+        etag = storage.data_version()
+        last_modified = parse_db_timestamp(storage.latest_timestamp(device_id))
+        if not_modified(etag):
+            return cacheable(app.response_class(status=304), last_modified, etag)
+        data = storage.range(device_id=device_id, start=start, end=end, limit=limit)
+        if request.args.get('format') == 'columnar':
+            columns = {'ts': [row['timestamp'] for row in data]}
+            if not device_id:
+                columns['device'] = [row['device_id'] for row in data]
+            columns['fuel'] = [row['fuel_level'] for row in data]
+            columns['temp'] = [row['temperature'] for row in data]
+            columns['count'] = len(data)
+            response = jsonify(columns)
+        else:
+            response = jsonify({'data': data, 'count': len(data)})
+        return cacheable(response, last_modified, etag)
     except Exception as e:
         logger.error(f"Error in /api/sensor-data/all: {e}")
         return jsonify({'error': str(e)}), 500
@@ -109,23 +243,44 @@ def handle_sensor_data():
     """
     if request.method == 'POST':
         try:
-            data = request.get_json()
+            data = request.get_json(silent=True)
             if not data:
+                admission.count_rejection('no_data')
                 return jsonify({'error': 'No data received'}), 400
-            # Extract sensor data
-            temperature = data.get('temperature', 0)
-            fuel_level = data.get('fuel_level', 0)
+            # Validate before anything touches the database; rate limit first so a
+            # device looping on bad payloads is throttled like any other
+            try:
+                device_id = get_device_id(data)
+            except ValidationError as e:
+                admission.count_rejection('invalid_payload')
+                logger.warning(f"Rejected sensor data: {e}")
+                return jsonify({'error': str(e)}), 400
+            retry_after = rate_limiter.check(device_id)
+            if retry_after:
+                admission.count_rejection('rate_limited')
+                response = jsonify({'error': 'Rate limit exceeded', 'device_id': device_id})
+                response.headers['Retry-After'] = str(math.ceil(retry_after))
+                return response, 429
+            try:
+                temperature, fuel_level = validate_sensor_payload(
+                    dict(data, device_id=device_id) if isinstance(data, dict) else data,
+                    TEMPERATURE_RANGE, FUEL_LEVEL_RANGE)
+            except ValidationError as e:
+                admission.count_rejection('invalid_payload')
+                logger.warning(f"Rejected sensor data: {e}")
+                return jsonify({'error': str(e)}), 400
             # Store in DB
-            insert_sensor_data(temperature, fuel_level, datetime.now())
-            logger.info(f"Received sensor data: temp={temperature}°C, fuel={fuel_level}%")
+            storage.ingest(device_id, datetime.now(), temperature, fuel_level)
+            logger.info(f"Received sensor data from {device_id}: temp={temperature}°C, fuel={fuel_level}%")
             return jsonify({'status': 'success', 'message': 'Data received and stored', 'timestamp': datetime.now().isoformat()}), 200
         except Exception as e:
             logger.error(f"Error receiving sensor data: {e}")
             return jsonify({'error': str(e)}), 500
     
     if request.method == 'GET':
+        device_id = get_device_id()
         try:
-            latest_data = get_latest_data()
+            latest_data = storage.latest(device_id)
             if latest_data:
                 return jsonify(latest_data), 200
             else:
@@ -136,57 +291,111 @@ def handle_sensor_data():
 
 @app.route('/api/commands', methods=['GET'])
 def get_commands():
-    """Return relay/buzzer commands for ESP32."""
-    return jsonify({
-        'relay': 'on' if relay_state else 'off',
-        'buzzer': buzzer_alert
-    })
+    """Return relay/buzzer commands for ESP32. Optional query param: ?device_id=genset-1"""
+    device_id = get_device_id()
+    relay = 'on' if relay_states.get(device_id, False) else 'off'
+    buzzer = buzzer_alerts.get(device_id, False)
+    # Commands change independently of ingest, so validate on their content;
+    # the device is already part of the URL the ETag belongs to
+    return cacheable(jsonify({'relay': relay, 'buzzer': buzzer}), etag=f"{relay}-{buzzer}")
 
 @app.route('/api/relay', methods=['POST'])
 def set_relay():
     """Set relay state from dashboard/AI."""
-    global relay_state
-    req = request.get_json()
-    state = req.get('state', '').lower()
+    req = request.get_json(silent=True)
+    if not isinstance(req, dict):
+        req = {}
+    device_id = get_device_id(req)
+    state = req.get('state', '')
+    if not isinstance(state, str):
+        return jsonify({'error': "'state' must be 'on' or 'off'"}), 400
+    state = state.lower()
     if state == 'on':
-        relay_state = True
+        relay_states[device_id] = True
     elif state == 'off':
-        relay_state = False
+        relay_states[device_id] = False
     else:
         return jsonify({'error': 'Invalid state'}), 400
-    return jsonify({'status': 'success', 'relay': 'on' if relay_state else 'off'})
+    return jsonify({'status': 'success', 'device_id': device_id, 'relay': state})
 
 @app.route('/api/buzzer', methods=['POST'])
 def set_buzzer():
     """Trigger buzzer alert from dashboard/AI (sets flag for ESP32 to buzz 2x on next poll)."""
-    global buzzer_alert
-    buzzer_alert = True
-    return jsonify({'status': 'success', 'buzzer': True})
+    device_id = get_device_id(request.get_json(silent=True))
+    buzzer_alerts[device_id] = True
+    return jsonify({'status': 'success', 'device_id': device_id, 'buzzer': True})
 
 # --- ESP32 should reset buzzer_alert after buzzing ---
 @app.route('/api/buzzer/reset', methods=['POST'])
 def reset_buzzer():
     """Reset buzzer alert flag after ESP32 buzzes."""
-    global buzzer_alert
-    buzzer_alert = False
-    return jsonify({'status': 'success', 'buzzer': False})
+    device_id = get_device_id(request.get_json(silent=True))
+    buzzer_alerts[device_id] = False
+    return jsonify({'status': 'success', 'device_id': device_id, 'buzzer': False})
+
+@app.route('/api/fleet', methods=['GET'])
+def get_fleet():
+    """
+    Return one page of per-device summaries: latest reading, alert state,
+    relay state and min/max/avg over the last FLEET_WINDOW_HOURS.
+    Optional query params: ?limit=50&offset=0
+    """
+    try:
+        limit = max(1, min(int(request.args.get('limit', FLEET_PAGE_SIZE)), 500))
+        offset = max(0, int(request.args.get('offset', 0)))
+    except ValueError as e:
+        return jsonify({'error': f'Invalid limit/offset: {e}'}), 400
+    try:
+        now = time.monotonic()
+        with _fleet_cache_lock:
+            cached = _fleet_cache.get((limit, offset))
+        if cached and cached[0] > now:
+            rows, total = cached[1], cached[2]
+        else:
+            since = datetime.now() - timedelta(hours=FLEET_WINDOW_HOURS)
+            rows, total = storage.fleet_summary(since, limit=limit, offset=offset)
+            with _fleet_cache_lock:
+                for key in [k for k, v in _fleet_cache.items() if v[0] <= now]:
+                    del _fleet_cache[key]
+                _fleet_cache[(limit, offset)] = (now + FLEET_CACHE_TTL, rows, total)
+        devices = [
+            dict(
+                row,
+                alerts=evaluate_alerts(row),
+                relay='on' if relay_states.get(row['device_id'], False) else 'off',
+                buzzer=buzzer_alerts.get(row['device_id'], False),
+            )
+            for row in rows
+        ]
+        return jsonify({
+            'devices': devices,
+            'total': total,
+            'limit': limit,
+            'offset': offset,
+            'window_hours': FLEET_WINDOW_HOURS,
+        }), 200
+    except Exception as e:
+        logger.error(f"Error in /api/fleet: {e}")
+        return jsonify({'error': str(e)}), 500
 
 @app.route('/api/status', methods=['GET'])
 def get_status():
     """Get current system status."""
+    device_id = get_device_id()
     try:
         # Get latest sensor data
-        latest_data = get_latest_data()
+        latest_data = storage.latest(device_id)
         
         if latest_data:
-            return jsonify({
+            response = jsonify({
                 'status': 'online',
                 'last_update': latest_data['timestamp'],
                 'sensor_data': {
                     'temperature': latest_data['temperature'],
                     'fuel_level': latest_data['fuel_level'],
                 }
-            }), 200
+            })
+            return cacheable(response, parse_db_timestamp(latest_data['timestamp']))
         else:
             return jsonify({
                 'status': 'no_data',
@@ -197,13 +406,23 @@ def get_status():
         logger.error(f"Error getting status: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/admission', methods=['GET'])
+def get_admission_stats():
+    """Load shedding, rejection and per-device rate limit counters for this process."""
+    return jsonify({
+        'admission': admission.stats(),
+        'rate_limit': rate_limiter.stats(),
+        'timestamp': datetime.now().isoformat()
+    }), 200
+
 @app.route('/api/config', methods=['GET'])
 def get_config():
     """Get system configuration."""
     try:
         return jsonify({
             'database_path': DB_FILE,
-            'groq_api_configured': bool(GROQ_API_KEY),
+            'storage_backend': storage.name,
+            'groq_api_configured': bool(os.getenv("GROQ_API_KEY")),
             'timestamp': datetime.now().isoformat()
         }), 200
     except Exception as e:
@@ -219,6 +438,8 @@ def test_endpoint():
         'endpoints': [
             '/health',
             '/api/sensor-data',
+            '/api/fleet',
+            '/api/admission',
             '/api/buzzer',
             '/api/status',
             '/api/config',
@@ -234,6 +455,8 @@ if __name__ == '__main__':
     logger.info("Available endpoints:")
     logger.info("  GET  /health - Health check")
     logger.info("  POST /api/sensor-data - Receive sensor data")
+    logger.info("  GET  /api/fleet - Per-device fleet summary")
+    logger.info("  GET  /api/admission - Rate limit and load shedding counters")
     logger.info("  POST /api/buzzer - Control buzzer")
     logger.info("  GET  /api/status - Get system status")
     logger.info("  GET  /api/config - Get configuration")
@@ -4,9 +4,11 @@
 import streamlit as st
 import pandas as pd
 
-# Define thresholds (example)
-FUEL_LOW_THRESHOLD = 20
-TEMP_HIGH_THRESHOLD = 70
+from config import THRESHOLDS
+
+# Same thresholds the API uses for /api/fleet alerts
+FUEL_LOW_THRESHOLD = THRESHOLDS["fuel_level"]
+TEMP_HIGH_THRESHOLD = THRESHOLDS["temperature"]
 
 def check_alerts(latest_data: pd.Series):
     """Checks the latest data point for alert conditions."""
@@ -0,0 +1,99 @@
+# src/components/fleet.py
+
+import math
+
+import streamlit as st
+import pandas as pd
+import requests
+
+from config import FLEET_PAGE_SIZE, FLEET_WINDOW_HOURS
+
+
+def fetch_fleet_page(api_url: str, page: int, page_size: int = FLEET_PAGE_SIZE, http=None) -> dict:
+    """Fetches one page of per-device summaries from /api/fleet."""
+    try:
+        resp = (http or requests).get(
+            f"{api_url}/api/fleet",
+            params={"limit": page_size, "offset": page * page_size},
+            timeout=5,
+        )
+        if resp.status_code == 200:
+            return resp.json()
+        st.error(f"API returned status code: {resp.status_code} for fleet overview")
+    except Exception as e:
+        st.error(f"Error fetching fleet overview from API: {e}")
+    return {"devices": [], "total": 0}
+
+
+def fleet_to_dataframe(devices: list) -> pd.DataFrame:
+    """Flattens /api/fleet device entries into one row per genset."""
+    rows = []
+    for d in devices:
+        window = d.get("window", {})
+        fuel = window.get("fuel_level", {})
+        temp = window.get("temperature", {})
+        rows.append({
+            "Device": d.get("device_id"),
+            "Last Update": d.get("timestamp"),
+            "Fuel Level": d.get("fuel_level"),
+            "Temperature": d.get("temperature"),
+            "Alerts": ", ".join(d.get("alerts", [])) or "OK",
+            "Relay": d.get("relay", "off").upper(),
+            "Fuel Min": fuel.get("min"),
+            "Fuel Avg": fuel.get("avg"),
+            "Fuel Max": fuel.get("max"),
+            "Temp Min": temp.get("min"),
+            "Temp Avg": temp.get("avg"),
+            "Temp Max": temp.get("max"),
+            "Readings": window.get("count", 0),
+        })
+    return pd.DataFrame(rows)
+
+
+def render_fleet_view(api_url: str, http=None):
+    """Renders a paginated overview of every genset from a single API request."""
+    st.markdown("### 🏭 Fleet Overview")
+
+    page_sizes = sorted({25, 50, 100, 200, FLEET_PAGE_SIZE})
+    page_size = st.sidebar.selectbox("Gensets per page", page_sizes,
+                                     index=page_sizes.index(FLEET_PAGE_SIZE))
+    page = st.session_state.get("fleet_page", 1)
+    data = fetch_fleet_page(api_url, page - 1, page_size, http)
+    total = data.get("total", 0)
+    pages = max(1, math.ceil(total / page_size))
+    if page > pages:
+        st.session_state["fleet_page"] = page = pages
+        data = fetch_fleet_page(api_url, page - 1, page_size, http)
+    page = st.sidebar.number_input("Page", min_value=1, max_value=pages, step=1, key="fleet_page")
+
+    df = fleet_to_dataframe(data.get("devices", []))
+    if df.empty:
+        st.info("No gensets have reported yet.")
+        return
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Gensets", total)
+    with col2:
+        st.metric("Alerting (this page)", int((df["Alerts"] != "OK").sum()))
+    with col3:
+        st.metric("Relays ON (this page)", int((df["Relay"] == "ON").sum()))
+
+    st.caption(f"Page {page} of {pages} · min/avg/max over the last {FLEET_WINDOW_HOURS}h")
+    # st.dataframe only renders the visible rows, so large pages stay cheap
+    st.dataframe(
+        df,
+        use_container_width=True,
+        hide_index=True,
+        height=min(35 * (len(df) + 1) + 3, 700),
+        column_config={
+            "Fuel Level": st.column_config.NumberColumn("⛽ Fuel Level", format="%.1f%%"),
+            "Temperature": st.column_config.NumberColumn("🌡️ Temperature", format="%.1f°C"),
+            "Fuel Min": st.column_config.NumberColumn(format="%.1f"),
+            "Fuel Avg": st.column_config.NumberColumn(format="%.1f"),
+            "Fuel Max": st.column_config.NumberColumn(format="%.1f"),
+            "Temp Min": st.column_config.NumberColumn(format="%.1f"),
+            "Temp Avg": st.column_config.NumberColumn(format="%.1f"),
+            "Temp Max": st.column_config.NumberColumn(format="%.1f"),
+        },
+    )
@@ -16,6 +16,34 @@ THRESHOLDS = {
     "temperature": 90   # Trigger alert if temp > 90°C
 }
 
+# Fleet settings
+DEFAULT_DEVICE_ID = "default"   # Used when a reading or command names no device
+FLEET_WINDOW_HOURS = 24         # Window for per-device min/max/avg in /api/fleet
+FLEET_CACHE_TTL = 5             # seconds; /api/fleet results are reused this long
+FLEET_PAGE_SIZE = 50
+
+# API response settings
+COMPRESS_MIN_SIZE = 500  # bytes; smaller JSON responses are sent uncompressed
+HISTORY_MAX_LIMIT = 10000  # most rows /api/sensor-data/all returns per request
+
+# Ingest protection (limits are per API server process)
+INGEST_RATE_PER_DEVICE = 1.0        # sustained readings per second per device
+INGEST_BURST = 5                    # readings a device may send back-to-back
+TEMPERATURE_RANGE = (-55.0, 125.0)  # °C, LM75 measuring range
+FUEL_LEVEL_RANGE = (0.0, 100.0)     # %
+ADMISSION_MAX_IN_FLIGHT = 32        # concurrent requests per process; needs gunicorn gthread workers
+# Fraction of ADMISSION_MAX_IN_FLIGHT each request class may use; lower shares are shed first
+ADMISSION_SHARES = {"command": 1.0, "ingest": 0.8, "read": 0.5}
+
+# Storage settings: one database for ingest, history and health checks
+DATABASE_PATH = os.environ.get("DATABASE_PATH", os.path.join(os.getcwd(), "data", "genset_monitoring.db"))
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "sqlite")  # "sqlite", "partitioned" or "memory"
+# Partitioned backend: one SQLite file per PARTITION_PERIOD ("month" or "day")
+PARTITION_DIR = os.environ.get("PARTITION_DIR", os.path.join(os.path.dirname(DATABASE_PATH), "partitions"))
+PARTITION_PERIOD = os.environ.get("PARTITION_PERIOD", "month")
+# Seconds startup waits for a migration running in another process before failing
+MIGRATION_WAIT_SECONDS = float(os.environ.get("MIGRATION_WAIT_SECONDS", 30))
+
 # Logging Directory
 LOG_DIR = os.path.join(os.getcwd(), "logs")
 if not os.path.exists(LOG_DIR):
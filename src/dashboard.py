@@ -1,60 +1,116 @@
+import time
+
+_RUN_STARTED = time.perf_counter()
+
 import streamlit as st
 import pandas as pd
 import json
-import time
 import requests
-from config import TITLE, LOG_DIR
+from config import TITLE, LOG_DIR, DEFAULT_DEVICE_ID, THRESHOLDS
 from components.charts import plot_time_series
 from components.alerts import check_alerts
+from components.fleet import render_fleet_view
 import os
-import groq  # For Groq API
-from dotenv import load_dotenv
 
 from streamlit_autorefresh import st_autorefresh
 
+# --- Rerun timing: Streamlit re-executes this script on every refresh ---
+_timings = []
+
+def mark(label):
+    """Record how long the current rerun took to reach this point."""
+    _timings.append((label, (time.perf_counter() - _RUN_STARTED) * 1000))
+
+@st.cache_resource
+def get_process_stats():
+    """Created once per server process; tracks the first (cold) run and rerun count."""
+    return {"first_run_ms": None, "reruns": 0}
+
+def render_timing_report():
+    """Show startup and per-rerun timings in the sidebar."""
+    mark("total")
+    stats = get_process_stats()
+    stats["reruns"] += 1
+    if stats["first_run_ms"] is None:
+        stats["first_run_ms"] = _timings[-1][1]
+    with st.sidebar.expander("⏱️ Startup / rerun timing"):
+        st.caption(f"Cold start (first run in this process): {stats['first_run_ms']:.0f} ms")
+        st.caption(f"Reruns so far: {stats['reruns']}")
+        previous = 0.0
+        for label, elapsed in _timings:
+            st.caption(f"{label}: {elapsed - previous:.1f} ms (at {elapsed:.1f} ms)")
+            previous = elapsed
+
+mark("imports")
+
 # --- Configuration ---
-os.makedirs(LOG_DIR, exist_ok=True)
+@st.cache_resource
+def load_settings():
+    """Read .env and environment once per process instead of on every rerun."""
+    from dotenv import load_dotenv
+    load_dotenv()
+    os.makedirs(LOG_DIR, exist_ok=True)
+    return {"groq_api_key": os.getenv("GROQ_API_KEY")}
+
+def get_http_session():
+    """
+    HTTP session for this browser session, so its polls reuse keep-alive
+    connections. Not cached per process: requests.Session is not thread-safe
+    and would share cookies between users.
+    """
+    if "http_session" not in st.session_state:
+        st.session_state["http_session"] = requests.Session()
+    return st.session_state["http_session"]
+
+http = get_http_session()
 
 # --- Initialize session state safely ---
+SESSION_DEFAULTS = {
+    "api_url": "https://genset-monitoring.onrender.com",
+    "device_id": DEFAULT_DEVICE_ID,
+    "esp32_relay_state": False,
+    "last_predicted_timestamp": None,
+    "last_groq_result": ("Unknown", "No prediction yet."),
+    "groq_client_initialized": False,
+    "groq_error_count": 0,
+}
+
 def initialize_session_state():
-    """Initialize all session state variables safely"""
-    if "api_url" not in st.session_state:
-        st.session_state["api_url"] = "https://genset-monitoring.onrender.com"
-    if "esp32_relay_state" not in st.session_state:
-        st.session_state["esp32_relay_state"] = False
-    if "last_predicted_timestamp" not in st.session_state:
-        st.session_state["last_predicted_timestamp"] = None
-    if "last_groq_result" not in st.session_state:
-        st.session_state["last_groq_result"] = ("Unknown", "No prediction yet.")
-    if "groq_client_initialized" not in st.session_state:
-        st.session_state["groq_client_initialized"] = False
-    if "groq_error_count" not in st.session_state:
-        st.session_state["groq_error_count"] = 0
+    """Initialize all session state variables safely (only once per browser session)"""
+    if st.session_state.get("session_initialized"):
+        return
+    for key, value in SESSION_DEFAULTS.items():
+        st.session_state.setdefault(key, value)
+    st.session_state["session_initialized"] = True
 
 # Initialize session state
 initialize_session_state()
 
 # --- Groq API Setup with error handling ---
+@st.cache_resource
+def get_groq_client():
+    """
+    Create the Groq client once per process; groq is only imported when a key is set.
+    Errors propagate so st.cache_resource doesn't cache them and the next rerun retries.
+    """
+    GROQ_API_KEY = load_settings()["groq_api_key"]
+    if not GROQ_API_KEY or GROQ_API_KEY == "default-fallback-key":
+        return None
+    import groq  # For Groq API
+    return groq.Groq(api_key=GROQ_API_KEY)
+
 def setup_groq_client():
     """Setup Groq client with proper error handling"""
     try:
-        load_dotenv()
-        GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-        
-        if not GROQ_API_KEY or GROQ_API_KEY == "default-fallback-key":
-            st.warning("⚠️ GROQ_API_KEY not found. AI analysis will be disabled.")
-            return None
-        
-        client = groq.Groq(api_key=GROQ_API_KEY)
-        st.session_state["groq_client_initialized"] = True
-        return client
+        client = get_groq_client()
     except Exception as e:
         st.error(f"❌ Failed to initialize Groq client: {e}")
-        st.session_state["groq_client_initialized"] = False
-        return None
-
-# Initialize Groq client
-groq_client = setup_groq_client()
+        client = None
+    else:
+        if client is None:
+            st.warning("⚠️ GROQ_API_KEY not found. AI analysis will be disabled.")
+    st.session_state["groq_client_initialized"] = client is not None
+    return client
 
 # --- API Server URL ---
 API_SERVER_URL = st.sidebar.text_input(
@@ -64,6 +120,25 @@ API_SERVER_URL = st.sidebar.text_input(
 )
 st.session_state["api_url"] = API_SERVER_URL
 
+view_mode = st.sidebar.radio("View", ("Single Genset", "Fleet Overview"))
+if view_mode == "Fleet Overview":
+    # One /api/fleet request per refresh instead of three requests per genset
+    st.title(TITLE)
+    render_fleet_view(API_SERVER_URL, http=http)
+    render_timing_report()
+    st_autorefresh(interval=3000, key="datarefresh")
+    st.stop()
+
+# Initialize Groq client (cached; the fleet view never needs it)
+groq_client = setup_groq_client()
+
+DEVICE_ID = st.sidebar.text_input(
+    "Device ID",
+    value=st.session_state.get("device_id", DEFAULT_DEVICE_ID),
+    help="Which genset to show and control"
+) or DEFAULT_DEVICE_ID
+st.session_state["device_id"] = DEVICE_ID
+
 # Sidebar controls for relay and buzzer
 st.sidebar.title("Genset Monitoring Controls")
 relay_state = st.sidebar.radio("Relay State", ("ON", "OFF"), index=0 if st.session_state.get('esp32_relay_state', False) else 1)
@@ -72,7 +147,7 @@ buzzer_notification_placeholder = st.sidebar.empty()
 if st.sidebar.button("Set Relay State"):
     relay_notification_placeholder.empty()  # Clear previous notification
     try:
-        resp = requests.post(f"{API_SERVER_URL}/api/relay", json={"state": relay_state.lower()})
+        resp = http.post(f"{API_SERVER_URL}/api/relay", json={"state": relay_state.lower(), "device_id": DEVICE_ID})
         if resp.status_code == 200:
             relay_notification_placeholder.success(f"Relay turned {relay_state}")
             st.session_state["esp32_relay_state"] = (relay_state == "ON")
@@ -84,7 +159,7 @@ if st.sidebar.button("Set Relay State"):
 if st.sidebar.button("Trigger Buzzer"):
     buzzer_notification_placeholder.empty()  # Clear previous notification
     try:
-        resp = requests.post(f"{API_SERVER_URL}/api/buzzer")
+        resp = http.post(f"{API_SERVER_URL}/api/buzzer", json={"device_id": DEVICE_ID})
         if resp.status_code == 200:
             buzzer_notification_placeholder.success("Buzzer triggered!")
         else:
@@ -93,9 +168,9 @@ if st.sidebar.button("Trigger Buzzer"):
         buzzer_notification_placeholder.error(f"Buzzer control error: {e}")
 
 # --- Fetch latest and historical data from API ---
-def fetch_latest_data_from_api(api_url):
+def fetch_latest_data_from_api(api_url, device_id=DEFAULT_DEVICE_ID):
     try:
-        resp = requests.get(f"{api_url}/api/sensor-data", timeout=5)
+        resp = http.get(f"{api_url}/api/sensor-data", params={"device_id": device_id}, timeout=5)
         if resp.status_code == 200:
             return resp.json()
         else:
@@ -105,12 +180,18 @@ def fetch_latest_data_from_api(api_url):
         st.error(f"Error fetching data from API: {e}")
         return None
 
-def fetch_historical_data_from_api(api_url, limit=100):
+def fetch_historical_data_from_api(api_url, limit=100, device_id=DEFAULT_DEVICE_ID):
     try:
-        resp = requests.get(f"{api_url}/api/sensor-data/all?limit={limit}", timeout=5)
+        resp = http.get(f"{api_url}/api/sensor-data/all",
+                            params={"limit": limit, "device_id": device_id, "format": "columnar"},
+                            timeout=5)
         if resp.status_code == 200:
-            data = resp.json().get('data', [])
-            return pd.DataFrame(data)
+            data = resp.json()
+            return pd.DataFrame({
+                'timestamp': data.get('ts', []),
+                'fuel_level': data.get('fuel', []),
+                'temperature': data.get('temp', []),
+            })
         else:
             st.error(f"API returned status code: {resp.status_code}")
             return pd.DataFrame()
@@ -119,9 +200,9 @@ def fetch_historical_data_from_api(api_url, limit=100):
         return pd.DataFrame()
 
 # --- Fetch relay status from API ---
-def fetch_relay_status_from_api(api_url):
+def fetch_relay_status_from_api(api_url, device_id=DEFAULT_DEVICE_ID):
     try:
-        resp = requests.get(f"{api_url}/api/commands", timeout=5)
+        resp = http.get(f"{api_url}/api/commands", params={"device_id": device_id}, timeout=5)
         if resp.status_code == 200:
             data = resp.json()
             return data.get('relay', 'off').upper()
@@ -137,9 +218,10 @@ st.title(TITLE)
 st.markdown("### Genset Monitoring Dashboard")
 st.caption("🔄 Dashboard auto-refreshes every 3 seconds for live data.")
 
-latest_data = fetch_latest_data_from_api(API_SERVER_URL)
-historical_df = fetch_historical_data_from_api(API_SERVER_URL, limit=100)
-relay_status_api = fetch_relay_status_from_api(API_SERVER_URL)
+latest_data = fetch_latest_data_from_api(API_SERVER_URL, DEVICE_ID)
+historical_df = fetch_historical_data_from_api(API_SERVER_URL, limit=100, device_id=DEVICE_ID)
+relay_status_api = fetch_relay_status_from_api(API_SERVER_URL, DEVICE_ID)
+mark("fetch")
 
 # Ensure timestamp is parsed and sorted ascending for charts and tables
 if not historical_df.empty and 'timestamp' in historical_df.columns:
@@ -224,6 +306,8 @@ if not historical_df.empty:
 else:
     st.info("No data available for the data table.")
 
+mark("metrics, charts, table")
+
 # Check and Display Alerts
 alerts_container = st.container()
 with alerts_container:
@@ -247,7 +331,7 @@ def predict_with_groq(data: dict, df_history: pd.DataFrame = None):
     temperature = data.get('temperature', 0)
     
     # Create shorter, more focused prompt to save tokens
-    prompt = f"Genset status: Fuel {fuel_level:.1f}% (safe: 20-100%), Temp {temperature:.1f}°C (safe: <70°C). Status and brief recommendation:"
+    prompt = f"Genset status: Fuel {fuel_level:.1f}% (safe: {THRESHOLDS['fuel_level']}-100%), Temp {temperature:.1f}°C (safe: <{THRESHOLDS['temperature']}°C). Status and brief recommendation:"
     
     try:
         response = groq_client.chat.completions.create(
@@ -308,5 +392,8 @@ with prediction_container:
     else:
         st.info("ℹ️ No sensor data available for AI analysis")
 
+mark("alerts, AI")
+render_timing_report()
+
 # Add this line to auto-refresh every 3 seconds (3000 ms)
 st_autorefresh(interval=3000, key="datarefresh")
\ No newline at end of file
@@ -0,0 +1,180 @@
+"""
+Ingest protection for the API server.
+
+- ``validate_sensor_payload`` rejects malformed, non-finite or out-of-range
+  readings before they reach storage.
+- ``DeviceRateLimiter`` gives every device its own token bucket, so one
+  looping ESP32 is throttled without affecting the rest of the fleet.
+- ``AdmissionController`` caps concurrent requests and sheds by priority when
+  the server is busy: commands are admitted longest, then ingest, then reads
+  such as history export.
+
+All state is per process; with several gunicorn workers each one enforces
+its own limits. Shedding only happens if a process serves requests
+concurrently: sync workers handle one request at a time, so run gunicorn with
+``--worker-class gthread --threads N`` (N >= ADMISSION_MAX_IN_FLIGHT), as
+render.yaml does.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+
+DEVICE_ID_MAX_LENGTH = 64
+
+# Request classes, highest priority first
+COMMAND = "command"
+INGEST = "ingest"
+READ = "read"
+PRIORITIES = (COMMAND, INGEST, READ)
+
+
+class ValidationError(ValueError):
+    """Raised for sensor payloads that must not be stored."""
+
+
+def _number(data, field, low, high):
+    value = data.get(field)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValidationError(f"'{field}' must be a number")
+    if not math.isfinite(value):
+        raise ValidationError(f"'{field}' must be finite")
+    if not low <= value <= high:
+        raise ValidationError(f"'{field}' must be between {low} and {high}")
+    return float(value)
+
+
+def validate_device_id(device_id):
+    """Return ``device_id`` if it is a usable device identifier, else raise ``ValidationError``."""
+    if (not isinstance(device_id, str) or not device_id
+            or len(device_id) > DEVICE_ID_MAX_LENGTH or not device_id.isprintable()):
+        raise ValidationError(f"'device_id' must be a printable string of 1-{DEVICE_ID_MAX_LENGTH} characters")
+    return device_id
+
+
+def validate_sensor_payload(data, temperature_range, fuel_level_range):
+    """
+    Check an ingest payload and return ``(temperature, fuel_level)``.
+    Raises ``ValidationError`` describing the first problem found.
+    """
+    if not isinstance(data, dict):
+        raise ValidationError("Payload must be a JSON object")
+    if data.get('device_id') is not None:
+        validate_device_id(data['device_id'])
+    temperature = _number(data, 'temperature', *temperature_range)
+    fuel_level = _number(data, 'fuel_level', *fuel_level_range)
+    return temperature, fuel_level
+
+
+class TokenBucket:
+    """Allows ``rate`` events per second on average with bursts up to ``capacity``."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self, now=None):
+        """Consume one token. Returns 0 if allowed, else seconds until a token is available."""
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class DeviceRateLimiter:
+    """One token bucket per device, keeping at most ``max_devices`` recently seen buckets."""
+
+    def __init__(self, rate, burst, max_devices=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_devices = max_devices
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.limited = 0
+        self.limited_by_device = {}
+
+    def check(self, device_id):
+        """Returns 0 if the device may send now, else seconds it should wait."""
+        with self._lock:
+            bucket = self._buckets.pop(device_id, None)
+            if bucket is None:
+                bucket = TokenBucket(self.rate, self.burst)
+                if len(self._buckets) >= self.max_devices:
+                    self._buckets.popitem(last=False)
+            self._buckets[device_id] = bucket
+            retry_after = bucket.take()
+            if retry_after:
+                self.limited += 1
+                self.limited_by_device[device_id] = self.limited_by_device.get(device_id, 0) + 1
+                if len(self.limited_by_device) > self.max_devices:
+                    self.limited_by_device.pop(next(iter(self.limited_by_device)))
+            else:
+                self.allowed += 1
+            return retry_after
+
+    def stats(self, top=10):
+        with self._lock:
+            worst = sorted(self.limited_by_device.items(), key=lambda item: item[1], reverse=True)
+            return {
+                'rate_per_device': self.rate,
+                'burst': self.burst,
+                'devices_tracked': len(self._buckets),
+                'allowed': self.allowed,
+                'limited': self.limited,
+                'top_limited_devices': dict(worst[:top]),
+            }
+
+
+class AdmissionController:
+    """
+    Caps requests in flight. Each priority may only start while the in-flight
+    count is below its share of ``max_in_flight``, so under load reads are
+    shed first, then ingest, and commands last.
+    """
+
+    def __init__(self, max_in_flight, shares):
+        self.max_in_flight = max_in_flight
+        self.limits = {p: max(1, int(max_in_flight * shares[p])) for p in PRIORITIES}
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.admitted = dict.fromkeys(PRIORITIES, 0)
+        self.shed = dict.fromkeys(PRIORITIES, 0)
+        self.rejected = {}  # reason -> count, for admitted requests refused by a handler
+        self._lock = threading.Lock()
+
+    def try_acquire(self, priority):
+        with self._lock:
+            if self.in_flight >= self.limits[priority]:
+                self.shed[priority] += 1
+                return False
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            self.admitted[priority] += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def count_rejection(self, reason):
+        with self._lock:
+            self.rejected[reason] = self.rejected.get(reason, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_in_flight': self.max_in_flight,
+                'limits': dict(self.limits),
+                'in_flight': self.in_flight,
+                'peak_in_flight': self.peak_in_flight,
+                'admitted': dict(self.admitted),
+                'shed': dict(self.shed),
+                'rejected': dict(self.rejected),
+            }
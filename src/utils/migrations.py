@@ -0,0 +1,353 @@
+"""
+Versioned, online schema migrations for the genset SQLite database.
+
+The schema version is stored in ``PRAGMA user_version``. Each migration moves
+the database from ``version - 1`` to ``version``. Migrations that need to
+rebuild ``sensor_data`` copy rows into a shadow table in small chunks, each in
+its own short transaction, so ESP32 inserts keep landing while the copy runs.
+Rows written during the copy are picked up by a catch-up pass and the final
+swap (copy remaining rows, rename old and new tables, bump version) happens in
+a single ``BEGIN IMMEDIATE`` transaction that only holds the write lock for the
+delta. The old table is emptied in chunks and dropped after the swap, since
+dropping a large table frees every one of its pages under the write lock.
+
+``sensor_data`` is append-only (``INSERT OR IGNORE``), so tracking the highest
+copied ``rowid`` is enough to find every row written since the copy started.
+"""
+
+import logging
+import sqlite3
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 5000
+# Pause between chunks so waiting writers can grab the lock
+DEFAULT_CHUNK_PAUSE = 0.01
+# Stop catching up and swap once a pass copies fewer rows than this
+CATCH_UP_THRESHOLD = 500
+# A lock not refreshed for this long is assumed to belong to a crashed run;
+# running migrations refresh it after every chunk they copy
+LOCK_STALE_SECONDS = 600
+
+SENSOR_DATA_COLUMNS = ("timestamp", "fuel_level", "temperature")
+
+SENSOR_DATA_DDL = '''
+    CREATE TABLE IF NOT EXISTS {table} (
+        timestamp TEXT PRIMARY KEY,
+        fuel_level REAL,
+        temperature REAL
+    )
+'''
+
+# Readings stored before devices were tracked belong to this device
+LEGACY_DEVICE_ID = "default"
+
+SENSOR_DATA_V2_COLUMNS = ("device_id", "timestamp", "fuel_level", "temperature")
+
+SENSOR_DATA_V2_DDL = '''
+    CREATE TABLE IF NOT EXISTS {table} (
+        device_id TEXT NOT NULL DEFAULT 'default',
+        timestamp TEXT NOT NULL,
+        fuel_level REAL,
+        temperature REAL,
+        PRIMARY KEY (device_id, timestamp)
+    )
+'''
+
+# Created on the shadow table before the copy; indexes follow it through the rename
+SENSOR_DATA_V2_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_sensor_data_timestamp ON {table} (timestamp)",
+)
+
+
+class MigrationError(Exception):
+    """Raised when a migration cannot be applied."""
+
+
+class Migration:
+    """A single schema step, applied by calling ``apply(conn, chunk_size, progress)``."""
+
+    def __init__(self, version, description, apply):
+        self.version = version
+        self.description = description
+        self.apply = apply
+
+
+def connect(db_path):
+    """Open a connection in autocommit mode so transactions are explicit."""
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA busy_timeout = 30000")
+    return conn
+
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def table_exists(conn, table):
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone()
+    return row is not None
+
+
+def table_columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def drop_table_online(conn, table, chunk_size=DEFAULT_CHUNK_SIZE, chunk_pause=DEFAULT_CHUNK_PAUSE):
+    """Delete ``table``'s rows in short transactions, then drop the empty table."""
+    if not table_exists(conn, table):
+        return
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = conn.execute(
+                f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} LIMIT ?)",
+                (chunk_size,),
+            )
+            _refresh_lock(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if cursor.rowcount < chunk_size:
+            break
+        time.sleep(chunk_pause)
+    conn.execute(f"DROP TABLE {table}")
+
+
+def rebuild_table_online(conn, table, create_sql, columns, select_exprs=None,
+                         indexes=(), version=None,
+                         chunk_size=DEFAULT_CHUNK_SIZE,
+                         chunk_pause=DEFAULT_CHUNK_PAUSE, progress=None):
+    """
+    Rebuild ``table`` with a new definition without blocking writers.
+
+    ``create_sql`` is a ``CREATE TABLE`` statement with a ``{table}``
+    placeholder for the shadow table name. ``columns`` are the target column
+    names and ``select_exprs`` the matching expressions read from the source
+    table (defaults to ``columns``). ``indexes`` are ``CREATE INDEX``
+    statements with a ``{table}`` placeholder; they are built on the empty
+    shadow table so each chunk maintains them incrementally and the swap never
+    builds an index. Their names must not be used by the source table. If
+    ``version`` is given, ``user_version`` is bumped in the swap transaction.
+
+    ``progress(copied, total)`` is called after every chunk; ``total`` is the
+    row count when the copy started and grows if catch-up finds new rows.
+    """
+    shadow = f"{table}_new"
+    retired = f"{table}_old"
+    select_exprs = select_exprs or columns
+    insert_sql = (
+        f"INSERT OR IGNORE INTO {shadow} ({', '.join(columns)}) "
+        f"SELECT {', '.join(select_exprs)} FROM {table} "
+        f"WHERE rowid > ? AND rowid <= ?"
+    )
+
+    # A previous run may have been interrupted mid-copy or before its cleanup
+    drop_table_online(conn, retired, chunk_size, chunk_pause)
+    drop_table_online(conn, shadow, chunk_size, chunk_pause)
+    conn.execute(create_sql.format(table=shadow))
+    for sql in indexes:
+        conn.execute(sql.format(table=shadow))
+
+    total = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    copied = 0
+    last_rowid = 0
+
+    def copy_chunk():
+        """Copy the next ``chunk_size`` source rows; returns how many were read."""
+        nonlocal copied, last_rowid
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            count, upper = conn.execute(
+                f"SELECT COUNT(*), MAX(rowid) FROM (SELECT rowid FROM {table} "
+                f"WHERE rowid > ? ORDER BY rowid LIMIT ?)",
+                (last_rowid, chunk_size),
+            ).fetchone()
+            if count:
+                conn.execute(insert_sql, (last_rowid, upper))
+            _refresh_lock(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if count:
+            last_rowid = upper
+            copied += count
+        return count
+
+    # Bulk copy, then keep catching up with rows written meanwhile
+    while True:
+        n = copy_chunk()
+        if progress:
+            progress(copied, max(total, copied))
+        if n < chunk_size:
+            break
+        time.sleep(chunk_pause)
+
+    while True:
+        pending = conn.execute(
+            f"SELECT COUNT(*) FROM {table} WHERE rowid > ?", (last_rowid,)
+        ).fetchone()[0]
+        if pending < CATCH_UP_THRESHOLD:
+            break
+        copy_chunk()
+        if progress:
+            progress(copied, copied + pending)
+        time.sleep(chunk_pause)
+
+    # Atomic swap: copy the last few rows and rename under one write lock.
+    # The old table is only renamed here; freeing its pages happens afterwards.
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        cursor = conn.execute(
+            f"INSERT OR IGNORE INTO {shadow} ({', '.join(columns)}) "
+            f"SELECT {', '.join(select_exprs)} FROM {table} WHERE rowid > ?",
+            (last_rowid,),
+        )
+        copied += max(cursor.rowcount, 0)
+        conn.execute(f"ALTER TABLE {table} RENAME TO {retired}")
+        conn.execute(f"ALTER TABLE {shadow} RENAME TO {table}")
+        if version is not None:
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+    drop_table_online(conn, retired, chunk_size, chunk_pause)
+    if progress:
+        progress(copied, copied)
+    return copied
+
+
+# --- Migrations ---
+
+def _migrate_v1_sensor_data(conn, chunk_size, progress):
+    """Create sensor_data, or rebuild it with only timestamp/fuel/temperature."""
+    if not table_exists(conn, "sensor_data"):
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(SENSOR_DATA_DDL.format(table="sensor_data"))
+        conn.execute("PRAGMA user_version = 1")
+        conn.execute("COMMIT")
+        return
+    if tuple(table_columns(conn, "sensor_data")) == SENSOR_DATA_COLUMNS:
+        conn.execute("PRAGMA user_version = 1")
+        return
+    rebuild_table_online(
+        conn, "sensor_data", SENSOR_DATA_DDL, SENSOR_DATA_COLUMNS,
+        version=1, chunk_size=chunk_size, progress=progress,
+    )
+
+
+def _migrate_v2_device_id(conn, chunk_size, progress):
+    """Key sensor_data by (device_id, timestamp) so several gensets can report."""
+    rebuild_table_online(
+        conn, "sensor_data", SENSOR_DATA_V2_DDL, SENSOR_DATA_V2_COLUMNS,
+        select_exprs=(f"'{LEGACY_DEVICE_ID}'",) + SENSOR_DATA_COLUMNS,
+        indexes=SENSOR_DATA_V2_INDEXES,
+        version=2, chunk_size=chunk_size, progress=progress,
+    )
+
+
+MIGRATIONS = [
+    Migration(1, "sensor_data with timestamp, fuel_level, temperature", _migrate_v1_sensor_data),
+    Migration(2, "sensor_data keyed by (device_id, timestamp)", _migrate_v2_device_id),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+# --- Cross-process lock so only one worker migrates at a time ---
+
+def _acquire_lock(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migration_lock (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            acquired_at REAL
+        )
+    ''')
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(
+            "DELETE FROM schema_migration_lock WHERE acquired_at < ?",
+            (now - LOCK_STALE_SECONDS,),
+        )
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO schema_migration_lock (id, acquired_at) VALUES (1, ?)",
+            (now,),
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return cursor.rowcount == 1
+
+
+def _refresh_lock(conn):
+    """Heartbeat so a long copy is never mistaken for a crashed run."""
+    try:
+        conn.execute(
+            "UPDATE schema_migration_lock SET acquired_at = ? WHERE id = 1", (time.time(),)
+        )
+    except sqlite3.OperationalError:
+        pass  # rebuild_table_online used outside run_migrations: no lock table
+
+
+def _release_lock(conn):
+    conn.execute("DELETE FROM schema_migration_lock WHERE id = 1")
+
+
+def run_migrations(db_path, target=None, chunk_size=DEFAULT_CHUNK_SIZE, progress=None, wait=0):
+    """
+    Apply every pending migration up to ``target`` (default: latest).
+
+    Returns the schema version after running. If another process holds the
+    migration lock, this waits up to ``wait`` seconds for it; after that
+    nothing is applied and the current version is returned.
+    ``progress(version, copied, total)`` is forwarded from table rebuilds.
+    """
+    target = LATEST_VERSION if target is None else target
+    conn = connect(db_path)
+    try:
+        deadline = time.monotonic() + wait
+        while True:
+            if get_schema_version(conn) >= target:
+                return get_schema_version(conn)
+            if _acquire_lock(conn):
+                break
+            if time.monotonic() >= deadline:
+                logger.warning(f"Schema migration still running in another process after {wait}s; not applied")
+                return get_schema_version(conn)
+            time.sleep(0.05)
+        try:
+            for migration in MIGRATIONS:
+                current = get_schema_version(conn)
+                if migration.version <= current or migration.version > target:
+                    continue
+                if migration.version != current + 1:
+                    raise MigrationError(
+                        f"Cannot apply migration {migration.version} on schema version {current}"
+                    )
+                logger.info(f"Applying migration {migration.version}: {migration.description}")
+                started = datetime.now()
+                step_progress = None
+                if progress:
+                    step_progress = lambda copied, total, v=migration.version: progress(v, copied, total)
+                migration.apply(conn, chunk_size, step_progress)
+                if get_schema_version(conn) != migration.version:
+                    raise MigrationError(f"Migration {migration.version} did not update user_version")
+                logger.info(
+                    f"Migration {migration.version} done in "
+                    f"{(datetime.now() - started).total_seconds():.1f}s"
+                )
+        finally:
+            _release_lock(conn)
+        return get_schema_version(conn)
+    finally:
+        conn.close()
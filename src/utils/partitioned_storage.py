@@ -0,0 +1,414 @@
+"""
+Time-partitioned SQLite storage.
+
+Readings are split into one SQLite file per month (or day), each with the
+normal ``sensor_data`` schema and indexes from ``src.utils.migrations``. A
+small catalog database records every partition and the time range it covers,
+so range and aggregate queries open only the partitions that overlap the
+requested window, and retention drops whole files instead of running a mass
+``DELETE`` against one ever-growing B-tree.
+
+The catalog also records which partitions each device has written to (one
+row per device and partition, added on its first reading there), so device
+lists and latest-reading lookups read the catalog plus a single partition
+per device instead of opening every file. Two catalog counters track changes:
+``generation`` (any stored or dropped reading, used for ETags) and ``layout``
+(partitions added or dropped, so other processes know to reload the list).
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+from src.config import DEFAULT_DEVICE_ID, MIGRATION_WAIT_SECONDS
+from src.utils.migrations import LATEST_VERSION, run_migrations
+from src.utils.storage import (
+    DEVICES_CTE, SensorStorage, TIMESTAMP_FORMAT, _reading, _where, _window, format_timestamp,
+)
+
+logger = logging.getLogger(__name__)
+
+CATALOG_FILE = "catalog.db"
+PERIODS = ("month", "day")
+
+
+def partition_bounds(timestamp, period):
+    """Name and [start, end) timestamp strings of the partition holding ``timestamp``."""
+    if isinstance(timestamp, str):
+        timestamp = datetime.strptime(timestamp, TIMESTAMP_FORMAT)
+    if period == "day":
+        start = datetime(timestamp.year, timestamp.month, timestamp.day)
+        end = start + timedelta(days=1)
+        name = start.strftime("%Y-%m-%d")
+    else:
+        start = datetime(timestamp.year, timestamp.month, 1)
+        end = datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+        name = start.strftime("%Y-%m")
+    return name, format_timestamp(start), format_timestamp(end)
+
+
+class Partition:
+    """One catalog entry: a SQLite file holding readings in [start, end)."""
+
+    def __init__(self, name, start, end, path):
+        self.name = name
+        self.start = start
+        self.end = end
+        self.path = path
+
+    def overlaps(self, start=None, end=None):
+        return (start is None or self.end > start) and (end is None or self.start <= end)
+
+
+class PartitionedSQLiteStorage(SensorStorage):
+    """Sensor readings split across per-period SQLite files with a partition catalog."""
+
+    name = "partitioned"
+
+    def __init__(self, directory, period="month"):
+        if period not in PERIODS:
+            raise ValueError(f"Unknown PARTITION_PERIOD '{period}' (expected one of: {', '.join(PERIODS)})")
+        self.directory = directory
+        self.period = period
+        self.catalog_path = os.path.join(directory, CATALOG_FILE)
+        self._lock = threading.Lock()
+        self._partitions = {}  # name -> Partition, refreshed from the catalog
+        self._layout = None  # catalog 'layout' counter the partition list was loaded at
+        self._seen = set()  # (device_id, partition name) pairs known to be catalogued
+
+    # --- Catalog ---
+
+    def init(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with sqlite3.connect(self.catalog_path) as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS partitions (
+                    name TEXT PRIMARY KEY,
+                    start TEXT NOT NULL,
+                    end TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    created_at TEXT NOT NULL
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS device_partitions (
+                    device_id TEXT NOT NULL,
+                    partition_name TEXT NOT NULL,
+                    first_seen TEXT NOT NULL,
+                    PRIMARY KEY (device_id, partition_name)
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS counters (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                )
+            ''')
+            conn.execute("INSERT OR IGNORE INTO counters (name, value) VALUES ('generation', 0), ('layout', 0)")
+            conn.commit()
+            indexed = {row[0] for row in conn.execute("SELECT DISTINCT partition_name FROM device_partitions")}
+        for partition in self.partitions():
+            if run_migrations(partition.path, wait=MIGRATION_WAIT_SECONDS) < LATEST_VERSION:
+                raise RuntimeError(f"Partition {partition.name} schema is not ready")
+            if partition.name not in indexed:
+                self._index_devices(partition)
+
+    def ping(self):
+        with sqlite3.connect(self.catalog_path) as conn:
+            conn.execute("SELECT 1 FROM partitions LIMIT 1")
+
+    def _refresh(self):
+        """Reload the catalog if another process added or dropped partitions."""
+        with sqlite3.connect(self.catalog_path) as conn:
+            layout = conn.execute("SELECT value FROM counters WHERE name = 'layout'").fetchone()[0]
+            if layout == self._layout:
+                return
+            rows = conn.execute("SELECT name, start, end, path FROM partitions").fetchall()
+        self._partitions = {
+            name: Partition(name, start, end, os.path.join(self.directory, path))
+            for name, start, end, path in rows
+        }
+        self._layout = layout
+
+    @staticmethod
+    def _bump(conn, *counters):
+        for name in counters:
+            conn.execute("UPDATE counters SET value = value + 1 WHERE name = ?", (name,))
+
+    def _bump_generation(self):
+        """Record that readings changed, after they are committed."""
+        with sqlite3.connect(self.catalog_path) as conn:
+            self._bump(conn, "generation")
+            conn.commit()
+
+    def partitions(self, start=None, end=None, newest_first=True):
+        """Catalogued partitions overlapping [start, end]."""
+        start, end = format_timestamp(start), format_timestamp(end)
+        with self._lock:
+            self._refresh()
+            selected = [p for p in self._partitions.values() if p.overlaps(start, end)]
+        return sorted(selected, key=lambda p: p.start, reverse=newest_first)
+
+    def _partition_for(self, timestamp):
+        """The partition covering ``timestamp``, created and catalogued on first use."""
+        name, start, end = partition_bounds(timestamp, self.period)
+        with self._lock:
+            self._refresh()
+            partition = self._partitions.get(name)
+        if partition:
+            return partition
+        filename = f"sensor_data_{name}.db"
+        path = os.path.join(self.directory, filename)
+        if run_migrations(path, wait=MIGRATION_WAIT_SECONDS) < LATEST_VERSION:
+            raise RuntimeError(f"Partition {name} schema is not ready")
+        with sqlite3.connect(self.catalog_path) as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO partitions (name, start, end, path, created_at) VALUES (?, ?, ?, ?, ?)",
+                (name, start, end, filename, format_timestamp(datetime.now())),
+            )
+            if cursor.rowcount:
+                self._bump(conn, "layout")
+            conn.commit()
+        logger.info(f"Created sensor data partition {name}")
+        partition = Partition(name, start, end, path)
+        with self._lock:
+            self._partitions[name] = partition
+        return partition
+
+    def _index_devices(self, partition):
+        """Catalog every device in a partition written before device tracking existed."""
+        with sqlite3.connect(partition.path) as conn:
+            device_ids = [row[0] for row in conn.execute(
+                f"{DEVICES_CTE} SELECT device_id FROM devices WHERE device_id IS NOT NULL"
+            )]
+        now = format_timestamp(datetime.now())
+        with sqlite3.connect(self.catalog_path) as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO device_partitions (device_id, partition_name, first_seen) VALUES (?, ?, ?)",
+                [(device_id, partition.name, now) for device_id in device_ids],
+            )
+            conn.commit()
+
+    def _note_device(self, device_id, partition):
+        """Catalog the first reading of a device in a partition; later readings skip this."""
+        key = (device_id, partition.name)
+        if key in self._seen:
+            return
+        with sqlite3.connect(self.catalog_path) as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO device_partitions (device_id, partition_name, first_seen) VALUES (?, ?, ?)",
+                (device_id, partition.name, format_timestamp(datetime.now())),
+            )
+            conn.commit()
+        with self._lock:
+            self._seen.add(key)
+
+    def _device_partitions(self, device_ids):
+        """device_id -> catalogued partitions it has written to, newest first."""
+        result = {device_id: [] for device_id in device_ids}
+        if not device_ids:
+            return result
+        with sqlite3.connect(self.catalog_path) as conn:
+            rows = conn.execute(f'''
+                SELECT device_id, partition_name FROM device_partitions
+                WHERE device_id IN ({', '.join('?' * len(device_ids))})
+            ''', list(device_ids)).fetchall()
+        partitions = {p.name: p for p in self.partitions()}
+        for device_id, name in rows:
+            if name in partitions:
+                result[device_id].append(partitions[name])
+        for candidates in result.values():
+            candidates.sort(key=lambda p: p.start, reverse=True)
+        return result
+
+    # --- SensorStorage ---
+
+    def ingest(self, device_id, timestamp, temperature, fuel_level):
+        partition = self._partition_for(timestamp)
+        # Catalog first: an entry without readings is skipped, readings without one would be lost
+        self._note_device(device_id, partition)
+        with sqlite3.connect(partition.path) as conn:
+            cursor = conn.execute('''
+                INSERT OR IGNORE INTO sensor_data (
+                    device_id, timestamp, fuel_level, temperature
+                ) VALUES (?, ?, ?, ?)
+            ''', (device_id, format_timestamp(timestamp), fuel_level, temperature))
+            conn.commit()
+        if cursor.rowcount:
+            self._bump_generation()
+
+    def ingest_many(self, readings):
+        """One transaction per partition touched."""
+        by_partition = {}
+        for device_id, timestamp, temperature, fuel_level in readings:
+            partition = self._partition_for(timestamp)
+            self._note_device(device_id, partition)
+            by_partition.setdefault(partition.path, []).append(
+                (device_id, format_timestamp(timestamp), fuel_level, temperature)
+            )
+        stored = 0
+        for path, rows in by_partition.items():
+            with sqlite3.connect(path) as conn:
+                cursor = conn.executemany('''
+                    INSERT OR IGNORE INTO sensor_data (
+                        device_id, timestamp, fuel_level, temperature
+                    ) VALUES (?, ?, ?, ?)
+                ''', rows)
+                conn.commit()
+            stored += cursor.rowcount
+        if stored:
+            self._bump_generation()
+
+    def latest(self, device_id=DEFAULT_DEVICE_ID):
+        for partition in self._device_partitions([device_id])[device_id]:
+            with sqlite3.connect(partition.path) as conn:
+                row = conn.execute('''
+                    SELECT timestamp, fuel_level, temperature
+                    FROM sensor_data WHERE device_id = ?
+                    ORDER BY timestamp DESC LIMIT 1
+                ''', (device_id,)).fetchone()
+            if row:
+                return _reading(device_id, *row)
+        return None
+
+    def latest_timestamp(self, device_id=None):
+        if device_id:
+            partitions = self._device_partitions([device_id])[device_id]
+        else:
+            partitions = self.partitions()
+        for partition in partitions:
+            with sqlite3.connect(partition.path) as conn:
+                if device_id:
+                    row = conn.execute(
+                        "SELECT MAX(timestamp) FROM sensor_data WHERE device_id = ?", (device_id,)
+                    ).fetchone()
+                else:
+                    row = conn.execute("SELECT MAX(timestamp) FROM sensor_data").fetchone()
+            if row and row[0]:
+                return row[0]
+        return None
+
+    def data_version(self):
+        """The catalog generation, bumped by every write to any partition and every drop."""
+        with sqlite3.connect(self.catalog_path) as conn:
+            return str(conn.execute("SELECT value FROM counters WHERE name = 'generation'").fetchone()[0])
+
+    def range(self, device_id=None, start=None, end=None, limit=100):
+        where, params = _where(device_id=device_id, start=start, end=end)
+        result = []
+        # Partitions don't overlap in time, so newest-first stops as soon as limit is met
+        for partition in self.partitions(start, end):
+            with sqlite3.connect(partition.path) as conn:
+                rows = conn.execute(f'''
+                    SELECT device_id, timestamp, fuel_level, temperature
+                    FROM sensor_data {where}
+                    ORDER BY timestamp DESC
+                    LIMIT ?
+                ''', (*params, limit - len(result))).fetchall()
+            result.extend(_reading(*row) for row in rows)
+            if len(result) >= limit:
+                break
+        return result
+
+    def aggregate(self, start, end=None, device_ids=None):
+        if device_ids is not None and not device_ids:
+            return {}
+        where, params = _where(device_ids=device_ids, start=start, end=end)
+        # Per device: count, then (n, sum, min, max) for fuel_level and temperature
+        totals = {}
+        for partition in self.partitions(start, end):
+            with sqlite3.connect(partition.path) as conn:
+                rows = conn.execute(f'''
+                    SELECT device_id, COUNT(*),
+                           COUNT(fuel_level), SUM(fuel_level), MIN(fuel_level), MAX(fuel_level),
+                           COUNT(temperature), SUM(temperature), MIN(temperature), MAX(temperature)
+                    FROM sensor_data {where}
+                    GROUP BY device_id
+                ''', params).fetchall()
+            for device_id, count, *columns in rows:
+                acc = totals.setdefault(device_id, [0, [0, 0.0, None, None], [0, 0.0, None, None]])
+                acc[0] += count
+                for column, (n, total, low, high) in zip(acc[1:], (columns[:4], columns[4:])):
+                    if not n:
+                        continue
+                    column[0] += n
+                    column[1] += total
+                    column[2] = low if column[2] is None else min(column[2], low)
+                    column[3] = high if column[3] is None else max(column[3], high)
+
+        def stats(column):
+            n, total, low, high = column
+            return low, high, (total / n if n else None)
+
+        return {
+            device_id: _window(count, *stats(fuel), *stats(temp))
+            for device_id, (count, fuel, temp) in totals.items()
+        }
+
+    def devices(self, limit=None, offset=0):
+        with sqlite3.connect(self.catalog_path) as conn:
+            total = conn.execute("SELECT COUNT(DISTINCT device_id) FROM device_partitions").fetchone()[0]
+            rows = conn.execute('''
+                SELECT DISTINCT device_id FROM device_partitions
+                ORDER BY device_id LIMIT ? OFFSET ?
+            ''', (-1 if limit is None else limit, offset)).fetchall()
+        return [row[0] for row in rows], total
+
+    def fleet_summary(self, since, limit=50, offset=0):
+        """
+        Each device's newest partition comes from the catalog; devices sharing a
+        partition are read with one grouped query.
+        """
+        device_ids, total = self.devices(limit, offset)
+        candidates = self._device_partitions(device_ids)
+        latest = {}
+        while True:
+            # Devices still missing a reading, grouped by the next partition to try
+            pending = {}
+            for device_id in device_ids:
+                if device_id not in latest and candidates[device_id]:
+                    partition = candidates[device_id].pop(0)
+                    pending.setdefault(partition.path, []).append(device_id)
+            if not pending:
+                break
+            for path, missing in pending.items():
+                with sqlite3.connect(path) as conn:
+                    # SQLite returns the other columns from the row holding MAX(timestamp)
+                    rows = conn.execute(f'''
+                        SELECT device_id, MAX(timestamp), fuel_level, temperature
+                        FROM sensor_data
+                        WHERE device_id IN ({', '.join('?' * len(missing))})
+                        GROUP BY device_id
+                    ''', missing).fetchall()
+                for row in rows:
+                    latest[row[0]] = _reading(*row)
+        stats = self.aggregate(since, device_ids=device_ids)
+        empty = _window(0, *([None] * 6))
+        return [
+            dict(latest[d], window=stats.get(d, empty))
+            for d in device_ids if d in latest
+        ], total
+
+    def drop_before(self, cutoff):
+        """Drop every partition that ends at or before ``cutoff`` by deleting its file."""
+        cutoff = format_timestamp(cutoff)
+        dropped = [p for p in self.partitions(newest_first=False) if p.end <= cutoff]
+        for partition in dropped:
+            with sqlite3.connect(self.catalog_path) as conn:
+                conn.execute("DELETE FROM partitions WHERE name = ?", (partition.name,))
+                conn.execute("DELETE FROM device_partitions WHERE partition_name = ?", (partition.name,))
+                self._bump(conn, "generation", "layout")
+                conn.commit()
+            for suffix in ("", "-journal", "-wal", "-shm"):
+                try:
+                    os.remove(partition.path + suffix)
+                except FileNotFoundError:
+                    pass
+            logger.info(f"Dropped sensor data partition {partition.name}")
+        dropped_names = {p.name for p in dropped}
+        with self._lock:
+            self._seen = {key for key in self._seen if key[1] not in dropped_names}
+        names = ", ".join(p.name for p in dropped) or "none"
+        return f"dropped {len(dropped)} partitions ({names})"
@@ -0,0 +1,444 @@
+"""
+Storage backends for genset sensor readings.
+
+Routes talk to a ``SensorStorage`` (ingest, latest, range, aggregate) instead
+of opening SQLite files themselves, so every endpoint reads and writes the
+same place. The backend is chosen once in ``src/config.py``:
+
+- ``sqlite``: the on-disk database at ``DATABASE_PATH`` (default)
+- ``partitioned``: one SQLite file per month or day under ``PARTITION_DIR``
+- ``memory``: an in-process store for tests and benchmarks
+
+A faster time-series engine can be added later by implementing the same
+interface and registering it in ``BACKENDS``.
+"""
+
+import bisect
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+
+from src.config import (
+    DATABASE_PATH, DEFAULT_DEVICE_ID, STORAGE_BACKEND, PARTITION_DIR, PARTITION_PERIOD,
+    MIGRATION_WAIT_SECONDS,
+)
+from src.utils.migrations import LATEST_VERSION, run_migrations
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Distinct device ids of sensor_data, found by hopping along the
+# (device_id, timestamp) primary key: one index seek per device instead of a
+# scan over every reading. Select from ``devices WHERE device_id IS NOT NULL``.
+DEVICES_CTE = '''
+    WITH RECURSIVE devices(device_id) AS (
+        SELECT MIN(device_id) FROM sensor_data
+        UNION ALL
+        SELECT (SELECT s.device_id FROM sensor_data s
+                WHERE s.device_id > devices.device_id
+                ORDER BY s.device_id LIMIT 1)
+        FROM devices WHERE devices.device_id IS NOT NULL
+    )
+'''
+
+
+def format_timestamp(value):
+    """Stored timestamps are local time strings that sort chronologically."""
+    if value is None or isinstance(value, str):
+        return value
+    return value.strftime(TIMESTAMP_FORMAT)
+
+
+def _reading(device_id, timestamp, fuel_level, temperature):
+    return {
+        "device_id": device_id,
+        "timestamp": timestamp,
+        "fuel_level": fuel_level,
+        "temperature": temperature,
+    }
+
+
+def _where(device_id=None, device_ids=None, start=None, end=None):
+    """``WHERE`` clause (or ``""``) and parameters filtering sensor_data by device and time."""
+    clauses, params = [], []
+    if device_id:
+        clauses.append("device_id = ?")
+        params.append(device_id)
+    if device_ids is not None:
+        clauses.append(f"device_id IN ({', '.join('?' * len(device_ids))})")
+        params.extend(device_ids)
+    if start is not None:
+        clauses.append("timestamp >= ?")
+        params.append(format_timestamp(start))
+    if end is not None:
+        clauses.append("timestamp <= ?")
+        params.append(format_timestamp(end))
+    return (f"WHERE {' AND '.join(clauses)}" if clauses else ""), params
+
+
+def _window(count, fuel_min, fuel_max, fuel_avg, temp_min, temp_max, temp_avg):
+    return {
+        "count": count or 0,
+        "fuel_level": {"min": fuel_min, "max": fuel_max, "avg": fuel_avg},
+        "temperature": {"min": temp_min, "max": temp_max, "avg": temp_avg},
+    }
+
+
+class SensorStorage(ABC):
+    """Interface every storage backend implements."""
+
+    name = None
+
+    def init(self):
+        """Prepare the backend (create files, apply migrations)."""
+
+    def ping(self):
+        """Raise if the backend is unreachable."""
+
+    @abstractmethod
+    def ingest(self, device_id, timestamp, temperature, fuel_level):
+        """Store one reading. A second reading for the same device and second is ignored."""
+
+    def ingest_many(self, readings):
+        """Store ``(device_id, timestamp, temperature, fuel_level)`` tuples, e.g. for imports."""
+        for reading in readings:
+            self.ingest(*reading)
+
+    @abstractmethod
+    def latest(self, device_id=DEFAULT_DEVICE_ID):
+        """Newest reading for a device as a dict, or None."""
+
+    @abstractmethod
+    def latest_timestamp(self, device_id=None):
+        """Timestamp string of the newest reading (for one device or overall), or None."""
+
+    @abstractmethod
+    def data_version(self):
+        """Opaque string that changes whenever a reading is stored or dropped (for ETags)."""
+
+    @abstractmethod
+    def range(self, device_id=None, start=None, end=None, limit=100):
+        """Readings with start <= timestamp <= end, newest first, at most ``limit``."""
+
+    @abstractmethod
+    def aggregate(self, start, end=None, device_ids=None):
+        """Per-device count/min/max/avg of readings in the window, keyed by device_id."""
+
+    @abstractmethod
+    def devices(self, limit=None, offset=0):
+        """Device ids in sorted order, and the total number of devices."""
+
+    @abstractmethod
+    def drop_before(self, cutoff):
+        """Delete readings older than ``cutoff`` (retention). Returns a short description."""
+
+    def fleet_summary(self, since, limit=50, offset=0):
+        """
+        Latest reading plus window stats since ``since`` for one page of devices.
+        Returns ``(rows, total_devices)``.
+        """
+        device_ids, total = self.devices(limit, offset)
+        stats = self.aggregate(since, device_ids=device_ids)
+        rows = []
+        for device_id in device_ids:
+            row = self.latest(device_id)
+            if row is None:
+                continue
+            row["window"] = stats.get(device_id, _window(0, *([None] * 6)))
+            rows.append(row)
+        return rows, total
+
+
+class SQLiteStorage(SensorStorage):
+    """Sensor readings in a single SQLite file, schema managed by migrations."""
+
+    name = "sqlite"
+    # Rows deleted per transaction by drop_before, so ingest is never blocked for long
+    DELETE_CHUNK_SIZE = 5000
+
+    def __init__(self, path):
+        self.path = path
+
+    def connect(self):
+        return sqlite3.connect(self.path)
+
+    def init(self):
+        db_dir = os.path.dirname(self.path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir, exist_ok=True)
+        version = run_migrations(self.path, wait=MIGRATION_WAIT_SECONDS)
+        if version < LATEST_VERSION:
+            raise RuntimeError(
+                f"{self.path} is at schema version {version}, expected {LATEST_VERSION}; "
+                "another process is still migrating it (see migrate_genset_db.py --status)"
+            )
+
+    def ping(self):
+        with self.connect() as conn:
+            conn.execute("SELECT 1")
+
+    def ingest(self, device_id, timestamp, temperature, fuel_level):
+        with self.connect() as conn:
+            conn.execute('''
+                INSERT OR IGNORE INTO sensor_data (
+                    device_id, timestamp, fuel_level, temperature
+                ) VALUES (?, ?, ?, ?)
+            ''', (device_id, format_timestamp(timestamp), fuel_level, temperature))
+            conn.commit()
+
+    def ingest_many(self, readings):
+        with self.connect() as conn:
+            conn.executemany('''
+                INSERT OR IGNORE INTO sensor_data (
+                    device_id, timestamp, fuel_level, temperature
+                ) VALUES (?, ?, ?, ?)
+            ''', [
+                (device_id, format_timestamp(timestamp), fuel_level, temperature)
+                for device_id, timestamp, temperature, fuel_level in readings
+            ])
+            conn.commit()
+
+    def latest(self, device_id=DEFAULT_DEVICE_ID):
+        with self.connect() as conn:
+            row = conn.execute('''
+                SELECT timestamp, fuel_level, temperature
+                FROM sensor_data WHERE device_id = ?
+                ORDER BY timestamp DESC LIMIT 1
+            ''', (device_id,)).fetchone()
+        if row:
+            return _reading(device_id, *row)
+        return None
+
+    def latest_timestamp(self, device_id=None):
+        with self.connect() as conn:
+            if device_id:
+                row = conn.execute(
+                    "SELECT MAX(timestamp) FROM sensor_data WHERE device_id = ?", (device_id,)
+                ).fetchone()
+            else:
+                row = conn.execute("SELECT MAX(timestamp) FROM sensor_data").fetchone()
+        return row[0] if row else None
+
+    def data_version(self):
+        # Inserts raise MAX(rowid) and retention raises MIN(rowid); separate
+        # subqueries so SQLite reads both from the ends of the B-tree
+        with self.connect() as conn:
+            low, high = conn.execute(
+                "SELECT (SELECT MIN(rowid) FROM sensor_data), (SELECT MAX(rowid) FROM sensor_data)"
+            ).fetchone()
+        return f"{low}-{high}"
+
+    def range(self, device_id=None, start=None, end=None, limit=100):
+        where, params = _where(device_id=device_id, start=start, end=end)
+        with self.connect() as conn:
+            rows = conn.execute(f'''
+                SELECT device_id, timestamp, fuel_level, temperature
+                FROM sensor_data {where}
+                ORDER BY timestamp DESC
+                LIMIT ?
+            ''', (*params, limit)).fetchall()
+        return [_reading(*row) for row in rows]
+
+    def aggregate(self, start, end=None, device_ids=None):
+        if device_ids is not None and not device_ids:
+            return {}
+        where, params = _where(device_ids=device_ids, start=start, end=end)
+        with self.connect() as conn:
+            rows = conn.execute(f'''
+                SELECT device_id, COUNT(*),
+                       MIN(fuel_level), MAX(fuel_level), AVG(fuel_level),
+                       MIN(temperature), MAX(temperature), AVG(temperature)
+                FROM sensor_data {where}
+                GROUP BY device_id
+            ''', params).fetchall()
+        return {row[0]: _window(*row[1:]) for row in rows}
+
+    def devices(self, limit=None, offset=0):
+        with self.connect() as conn:
+            rows = conn.execute(f'''{DEVICES_CTE}
+                SELECT device_id FROM devices WHERE device_id IS NOT NULL ORDER BY device_id
+            ''').fetchall()
+        ids = [row[0] for row in rows]
+        end = None if limit is None else offset + limit
+        return ids[offset:end], len(ids)
+
+    def drop_before(self, cutoff):
+        deleted = 0
+        with self.connect() as conn:
+            while True:
+                cursor = conn.execute('''
+                    DELETE FROM sensor_data WHERE rowid IN (
+                        SELECT rowid FROM sensor_data WHERE timestamp < ? LIMIT ?
+                    )
+                ''', (format_timestamp(cutoff), self.DELETE_CHUNK_SIZE))
+                conn.commit()
+                deleted += cursor.rowcount
+                if cursor.rowcount < self.DELETE_CHUNK_SIZE:
+                    break
+        return f"deleted {deleted} rows"
+
+    def fleet_summary(self, since, limit=50, offset=0):
+        """
+        Runs as a single query: devices are enumerated by hopping along the
+        (device_id, timestamp) primary key, each latest row is a single index
+        lookup, and the window aggregates only read rows newer than ``since``
+        for the devices on the page.
+        """
+        with self.connect() as conn:
+            rows = conn.execute(f'''{DEVICES_CTE},
+                page AS (
+                    SELECT device_id, COUNT(*) OVER () AS total
+                    FROM devices WHERE device_id IS NOT NULL
+                    ORDER BY device_id LIMIT ? OFFSET ?
+                ),
+                window_stats AS (
+                    SELECT device_id, COUNT(*) AS n,
+                           MIN(fuel_level) AS fuel_min, MAX(fuel_level) AS fuel_max,
+                           AVG(fuel_level) AS fuel_avg,
+                           MIN(temperature) AS temp_min, MAX(temperature) AS temp_max,
+                           AVG(temperature) AS temp_avg
+                    FROM sensor_data
+                    WHERE device_id IN (SELECT device_id FROM page) AND timestamp >= ?
+                    GROUP BY device_id
+                )
+                SELECT p.device_id, p.total, l.timestamp, l.fuel_level, l.temperature,
+                       w.n, w.fuel_min, w.fuel_max, w.fuel_avg,
+                       w.temp_min, w.temp_max, w.temp_avg
+                FROM page p
+                JOIN sensor_data l ON l.device_id = p.device_id AND l.timestamp = (
+                    SELECT MAX(timestamp) FROM sensor_data WHERE device_id = p.device_id
+                )
+                LEFT JOIN window_stats w ON w.device_id = p.device_id
+                ORDER BY p.device_id
+            ''', (limit, offset, format_timestamp(since))).fetchall()
+            if rows:
+                total = rows[0][1]
+            else:
+                # Page past the end: the count can't ride along on the page rows
+                total = conn.execute(
+                    f"{DEVICES_CTE} SELECT COUNT(*) FROM devices WHERE device_id IS NOT NULL"
+                ).fetchone()[0]
+        return [
+            dict(_reading(row[0], *row[2:5]), window=_window(*row[5:]))
+            for row in rows
+        ], total
+
+
+class MemoryStorage(SensorStorage):
+    """In-process storage for tests and benchmarks; nothing is persisted."""
+
+    name = "memory"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # device_id -> (sorted timestamps, matching (fuel_level, temperature) values)
+        self._series = {}
+        self._version = 0
+
+    def ingest(self, device_id, timestamp, temperature, fuel_level):
+        timestamp = format_timestamp(timestamp)
+        with self._lock:
+            timestamps, values = self._series.setdefault(device_id, ([], []))
+            i = bisect.bisect_left(timestamps, timestamp)
+            if i < len(timestamps) and timestamps[i] == timestamp:
+                return
+            timestamps.insert(i, timestamp)
+            values.insert(i, (fuel_level, temperature))
+            self._version += 1
+
+    def latest(self, device_id=DEFAULT_DEVICE_ID):
+        with self._lock:
+            timestamps, values = self._series.get(device_id, ([], []))
+            if not timestamps:
+                return None
+            return _reading(device_id, timestamps[-1], *values[-1])
+
+    def latest_timestamp(self, device_id=None):
+        with self._lock:
+            if device_id:
+                timestamps = self._series.get(device_id, ([], []))[0]
+                return timestamps[-1] if timestamps else None
+            return max((t[-1] for t, _ in self._series.values() if t), default=None)
+
+    def data_version(self):
+        with self._lock:
+            return str(self._version)
+
+    def _rows_between(self, device_id, start, end):
+        """(timestamp, fuel_level, temperature) rows of one device inside [start, end]."""
+        timestamps, values = self._series.get(device_id, ([], []))
+        lo = 0 if start is None else bisect.bisect_left(timestamps, format_timestamp(start))
+        hi = len(timestamps) if end is None else bisect.bisect_right(timestamps, format_timestamp(end))
+        return [(timestamps[i], *values[i]) for i in range(lo, hi)]
+
+    def range(self, device_id=None, start=None, end=None, limit=100):
+        with self._lock:
+            device_ids = [device_id] if device_id else list(self._series)
+            rows = [
+                _reading(d, *r)
+                for d in device_ids
+                for r in self._rows_between(d, start, end)
+            ]
+        rows.sort(key=lambda r: r["timestamp"], reverse=True)
+        return rows[:limit]
+
+    def aggregate(self, start, end=None, device_ids=None):
+        result = {}
+        with self._lock:
+            for device_id in (list(self._series) if device_ids is None else device_ids):
+                window = self._rows_between(device_id, start, end)
+                if not window:
+                    continue
+                fuel = [r[1] for r in window if r[1] is not None]
+                temp = [r[2] for r in window if r[2] is not None]
+                result[device_id] = _window(
+                    len(window),
+                    min(fuel, default=None), max(fuel, default=None),
+                    sum(fuel) / len(fuel) if fuel else None,
+                    min(temp, default=None), max(temp, default=None),
+                    sum(temp) / len(temp) if temp else None,
+                )
+        return result
+
+    def devices(self, limit=None, offset=0):
+        with self._lock:
+            ids = sorted(d for d, (t, _) in self._series.items() if t)
+        end = None if limit is None else offset + limit
+        return ids[offset:end], len(ids)
+
+    def drop_before(self, cutoff):
+        cutoff = format_timestamp(cutoff)
+        deleted = 0
+        with self._lock:
+            for timestamps, values in self._series.values():
+                i = bisect.bisect_left(timestamps, cutoff)
+                del timestamps[:i], values[:i]
+                deleted += i
+            self._version += 1
+        return f"deleted {deleted} rows"
+
+
+def _partitioned_storage():
+    from src.utils.partitioned_storage import PartitionedSQLiteStorage
+    return PartitionedSQLiteStorage(PARTITION_DIR, PARTITION_PERIOD)
+
+
+BACKENDS = {
+    "sqlite": lambda: SQLiteStorage(DATABASE_PATH),
+    "partitioned": _partitioned_storage,
+    "memory": MemoryStorage,
+}
+
+_storage = None
+
+
+def get_storage():
+    """The configured storage backend, created on first use."""
+    global _storage
+    if _storage is None:
+        if STORAGE_BACKEND not in BACKENDS:
+            raise ValueError(
+                f"Unknown STORAGE_BACKEND '{STORAGE_BACKEND}' (expected one of: {', '.join(BACKENDS)})"
+            )
+        _storage = BACKENDS[STORAGE_BACKEND]()
+    return _storage
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Tests import the app as ``src.*``, like the scripts in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Importing src.api_server must not create or migrate a real database
+os.environ.setdefault("STORAGE_BACKEND", "memory")
@@ -0,0 +1,56 @@
+import math
+
+import pytest
+
+from src.utils.admission import (
+    COMMAND, INGEST, READ, AdmissionController, DeviceRateLimiter, TokenBucket,
+    ValidationError, validate_sensor_payload,
+)
+
+
+def test_token_bucket_allows_burst_then_refills():
+    bucket = TokenBucket(rate=2.0, capacity=3)
+    now = bucket.updated
+    assert [bucket.take(now) for _ in range(3)] == [0, 0, 0]
+    assert bucket.take(now) == pytest.approx(0.5)
+    assert bucket.take(now + 0.5) == 0
+    # A long pause refills only up to capacity
+    assert [bucket.take(now + 100) for _ in range(3)] == [0, 0, 0]
+    assert bucket.take(now + 100) > 0
+
+
+def test_rate_limiter_is_per_device():
+    limiter = DeviceRateLimiter(rate=1.0, burst=2)
+    assert limiter.check("looping") == 0
+    assert limiter.check("looping") == 0
+    assert limiter.check("looping") > 0
+    assert limiter.check("quiet") == 0
+    assert limiter.stats()["top_limited_devices"] == {"looping": 1}
+
+
+def test_admission_sheds_reads_then_ingest_then_commands():
+    controller = AdmissionController(10, {COMMAND: 1.0, INGEST: 0.8, READ: 0.5})
+    for _ in range(5):
+        assert controller.try_acquire(COMMAND)
+    assert not controller.try_acquire(READ)  # reads stop at 5 in flight
+    for _ in range(3):
+        assert controller.try_acquire(INGEST)
+    assert not controller.try_acquire(INGEST)  # ingest stops at 8
+    for _ in range(2):
+        assert controller.try_acquire(COMMAND)
+    assert not controller.try_acquire(COMMAND)  # commands get the full 10
+    assert controller.stats()["shed"] == {COMMAND: 1, INGEST: 1, READ: 1}
+    for _ in range(6):
+        controller.release()
+    assert controller.try_acquire(READ)
+
+
+@pytest.mark.parametrize("payload", [
+    {"temperature": math.nan, "fuel_level": 50},
+    {"temperature": 500, "fuel_level": 50},
+    {"temperature": 40, "fuel_level": True},
+    {"temperature": 40, "fuel_level": 50, "device_id": ""},
+])
+def test_invalid_payloads_are_rejected(payload):
+    with pytest.raises(ValidationError):
+        validate_sensor_payload(payload, (-55.0, 125.0), (0.0, 100.0))
@@ -0,0 +1,155 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import src.api_server as api
+from src.utils.admission import AdmissionController, DeviceRateLimiter
+from src.utils.storage import MemoryStorage
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """Test client with empty storage, commands, caches and limits."""
+    monkeypatch.setattr(api, "storage", MemoryStorage())
+    monkeypatch.setattr(api, "rate_limiter", DeviceRateLimiter(api.INGEST_RATE_PER_DEVICE, api.INGEST_BURST))
+    monkeypatch.setattr(api, "admission", AdmissionController(api.ADMISSION_MAX_IN_FLIGHT, api.ADMISSION_SHARES))
+    monkeypatch.setattr(api, "relay_states", {})
+    monkeypatch.setattr(api, "buzzer_alerts", {})
+    monkeypatch.setattr(api, "_fleet_cache", {})
+    return api.app.test_client()
+
+
+def test_fleet_summarises_each_device(client):
+    now = datetime.now().replace(microsecond=0)
+    api.storage.ingest("genset-1", now - timedelta(minutes=5), 60.0, 80.0)
+    api.storage.ingest("genset-1", now, 95.0, 70.0)
+    api.storage.ingest("genset-2", now, 40.0, 10.0)
+    client.post("/api/relay", json={"device_id": "genset-2", "state": "on"})
+
+    body = client.get("/api/fleet").get_json()
+    assert body["total"] == 2
+    first, second = body["devices"]
+    assert (first["device_id"], first["temperature"], first["alerts"]) == ("genset-1", 95.0, ["high_temperature"])
+    assert first["window"]["count"] == 2 and first["window"]["fuel_level"]["min"] == 70.0
+    assert (second["relay"], second["alerts"]) == ("on", ["low_fuel"])
+
+
+def test_fleet_page_past_the_end_keeps_total(client):
+    api.storage.ingest("genset-1", datetime.now(), 40.0, 50.0)
+    body = client.get("/api/fleet?offset=100").get_json()
+    assert (body["devices"], body["total"]) == ([], 1)
+
+
+@pytest.mark.parametrize("query", ["limit=x", "offset=x"])
+def test_fleet_rejects_bad_paging(client, query):
+    assert client.get(f"/api/fleet?{query}").status_code == 400
+
+
+@pytest.mark.parametrize("path, status", [("/api/relay", 400), ("/api/buzzer", 200), ("/api/buzzer/reset", 200)])
+def test_command_routes_ignore_non_object_bodies(client, path, status):
+    response = client.post(path, json=["genset-1"])
+    assert response.status_code == status
+    if status == 200:
+        assert response.get_json()["device_id"] == api.DEFAULT_DEVICE_ID
+
+
+def test_relay_rejects_non_string_state(client):
+    assert client.post("/api/relay", json={"state": 1}).status_code == 400
+    assert client.post("/api/relay", json={"state": "ON"}).get_json()["relay"] == "on"
+
+
+def test_history_etag_revalidates_on_every_reading(client):
+    now = datetime.now().replace(microsecond=0)
+    api.storage.ingest("genset-1", now, 40.0, 50.0)
+    first = client.get("/api/sensor-data/all")
+    etag = first.headers["ETag"]
+    assert etag.startswith("W/")
+    assert client.get("/api/sensor-data/all", headers={"If-None-Match": etag}).status_code == 304
+    # Another device in the same second: Last-Modified can't tell, the ETag does
+    api.storage.ingest("genset-2", now, 41.0, 51.0)
+    second = client.get("/api/sensor-data/all", headers={"If-None-Match": etag})
+    assert second.status_code == 200 and second.get_json()["count"] == 2
+
+
+def test_history_etag_is_the_same_for_compressed_and_plain_bodies(client):
+    now = datetime.now().replace(microsecond=0)
+    for i in range(50):
+        api.storage.ingest("genset-1", now - timedelta(seconds=i), 40.0, 50.0)
+    plain = client.get("/api/sensor-data/all", headers={"Accept-Encoding": "identity"})
+    packed = client.get("/api/sensor-data/all", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in plain.headers
+    assert packed.headers["Content-Encoding"] in ("gzip", "br")
+    assert "Accept-Encoding" in packed.headers["Vary"]
+    assert plain.headers["ETag"] == packed.headers["ETag"] and plain.headers["ETag"].startswith("W/")
+
+
+def test_history_columnar_format(client):
+    now = datetime.now().replace(microsecond=0)
+    api.storage.ingest("genset-1", now - timedelta(seconds=1), 40.0, 50.0)
+    api.storage.ingest("genset-2", now, 41.0, 51.0)
+    body = client.get("/api/sensor-data/all?format=columnar").get_json()
+    assert body["device"] == ["genset-2", "genset-1"]
+    assert (body["fuel"], body["temp"], body["count"]) == ([51.0, 50.0], [41.0, 40.0], 2)
+    body = client.get("/api/sensor-data/all?format=columnar&device_id=genset-1").get_json()
+    assert "device" not in body and body["fuel"] == [50.0]
+
+
+def test_commands_etag_and_device_id_validation(client):
+    first = client.get("/api/commands?device_id=genset-1")
+    assert client.get("/api/commands?device_id=genset-1",
+                      headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
+    client.post("/api/relay", json={"device_id": "genset-1", "state": "on"})
+    changed = client.get("/api/commands?device_id=genset-1", headers={"If-None-Match": first.headers["ETag"]})
+    assert changed.status_code == 200 and changed.get_json()["relay"] == "on"
+    # Quotes are fine in a device id's URL; they just never reach the ETag
+    assert client.get('/api/commands?device_id=a"b').status_code == 200
+    assert client.get("/api/commands?device_id=" + "x" * 65).status_code == 400
+    assert client.get("/api/sensor-data/all?device_id=" + "x" * 65).status_code == 400
+
+
+@pytest.mark.parametrize("query, count", [("limit=-1", 1), ("limit=0", 1), ("limit=2", 2), ("limit=999999", 3)])
+def test_history_limit_is_clamped(client, query, count):
+    now = datetime.now().replace(microsecond=0)
+    for i in range(3):
+        api.storage.ingest("genset-1", now - timedelta(seconds=i), 40.0, 50.0)
+    assert client.get(f"/api/sensor-data/all?{query}").get_json()["count"] == count
+
+
+@pytest.mark.parametrize("query", ["start=bogus", "end=2025-13-01", "limit=x"])
+def test_history_rejects_bad_query_parameters(client, query):
+    assert client.get(f"/api/sensor-data/all?{query}").status_code == 400
+
+
+def test_ingest_rejects_invalid_readings(client):
+    response = client.post("/api/sensor-data", json={"temperature": 500, "fuel_level": 50})
+    assert response.status_code == 400
+    assert client.post("/api/sensor-data", json=["not", "an", "object"]).status_code == 400
+    assert client.get("/api/admission").get_json()["admission"]["rejected"]["invalid_payload"] == 2
+
+
+def test_ingest_is_rate_limited_per_device_even_for_bad_payloads(client):
+    statuses = [
+        client.post("/api/sensor-data", json={"device_id": "looping", "temperature": 500, "fuel_level": 50}).status_code
+        for _ in range(api.INGEST_BURST + 1)
+    ]
+    assert statuses == [400] * api.INGEST_BURST + [429]
+    limited = client.post("/api/sensor-data", json={"device_id": "looping", "temperature": 40, "fuel_level": 50})
+    assert limited.status_code == 429 and int(limited.headers["Retry-After"]) >= 1
+    ok = client.post("/api/sensor-data", json={"device_id": "quiet", "temperature": 40, "fuel_level": 50})
+    assert ok.status_code == 200
+    assert api.storage.latest("quiet")["temperature"] == 40
+
+
+def test_busy_server_sheds_reads_then_ingest_but_not_commands(client, monkeypatch):
+    controller = AdmissionController(4, api.ADMISSION_SHARES)  # limits: read 2, ingest 3, command 4
+    monkeypatch.setattr(api, "admission", controller)
+    reading = {"device_id": "genset-1", "temperature": 40, "fuel_level": 50}
+    controller.try_acquire("command")
+    controller.try_acquire("command")  # two requests in flight
+    shed = client.get("/api/fleet")
+    assert shed.status_code == 503 and shed.headers["Retry-After"] == "1"
+    assert client.post("/api/sensor-data", json=reading).status_code == 200
+    controller.try_acquire("command")  # three in flight
+    assert client.post("/api/sensor-data", json=reading).status_code == 503
+    assert client.get("/api/commands").status_code == 200
+    assert controller.stats()["shed"] == {"command": 0, "ingest": 1, "read": 1}
@@ -0,0 +1,99 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from src.utils import migrations
+from src.utils.storage import SQLiteStorage
+
+
+def make_v1_database(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute(migrations.SENSOR_DATA_DDL.format(table="sensor_data"))
+    conn.executemany(
+        "INSERT INTO sensor_data VALUES (?, ?, ?)",
+        [(f"2025-01-01 {i:08d}", 50.0, 60.0) for i in range(rows)],
+    )
+    conn.execute("PRAGMA user_version = 1")
+    conn.commit()
+    conn.close()
+
+
+def test_online_rebuild_keeps_rows_written_during_copy(tmp_path):
+    path = str(tmp_path / "genset.db")
+    make_v1_database(path, 20000)
+    written, errors = [], []
+    stop = threading.Event()
+
+    def writer():
+        conn = sqlite3.connect(path, timeout=30)
+        while not stop.is_set():
+            try:
+                conn.execute(
+                    "INSERT INTO sensor_data (timestamp, fuel_level, temperature) VALUES (?, 1, 1)",
+                    (f"2025-02-01 {len(written):08d}",),
+                )
+                conn.commit()
+                written.append(1)
+            except sqlite3.Error as e:
+                errors.append(e)
+            time.sleep(0.001)
+        conn.close()
+
+    heartbeats = []
+
+    def progress(version, copied, total):
+        conn = sqlite3.connect(path)
+        try:
+            heartbeats.append(conn.execute("SELECT acquired_at FROM schema_migration_lock").fetchone())
+        finally:
+            conn.close()
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        version = migrations.run_migrations(path, chunk_size=1000, progress=progress)
+    finally:
+        stop.set()
+        thread.join()
+
+    conn = sqlite3.connect(path)
+    count = conn.execute("SELECT COUNT(*) FROM sensor_data").fetchone()[0]
+    columns = migrations.table_columns(conn, "sensor_data")
+    indexes = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'sensor_data'")]
+    tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    conn.close()
+
+    assert version == migrations.LATEST_VERSION
+    assert errors == []
+    assert count == 20000 + len(written)
+    assert tuple(columns) == migrations.SENSOR_DATA_V2_COLUMNS
+    assert "idx_sensor_data_timestamp" in indexes
+    # The retired table is emptied and dropped after the swap
+    assert "sensor_data_old" not in tables and "sensor_data_new" not in tables
+    # The lock is refreshed by every chunk, not only when it was taken
+    assert len(set(heartbeats)) > 1
+
+
+def test_drop_table_online_leaves_no_table(tmp_path):
+    path = str(tmp_path / "genset.db")
+    make_v1_database(path, 2500)
+    conn = migrations.connect(path)
+    migrations.drop_table_online(conn, "sensor_data", chunk_size=1000, chunk_pause=0)
+    assert not migrations.table_exists(conn, "sensor_data")
+    migrations.drop_table_online(conn, "sensor_data")  # already gone: no-op
+    conn.close()
+
+
+def test_startup_fails_while_another_process_migrates(tmp_path, monkeypatch):
+    path = str(tmp_path / "genset.db")
+    conn = migrations.connect(path)
+    assert migrations._acquire_lock(conn)
+    monkeypatch.setattr("src.utils.storage.MIGRATION_WAIT_SECONDS", 0.1)
+    with pytest.raises(RuntimeError):
+        SQLiteStorage(path).init()
+    migrations._release_lock(conn)
+    conn.close()
+    SQLiteStorage(path).init()
@@ -0,0 +1,116 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.utils.partitioned_storage import PartitionedSQLiteStorage
+from src.utils.storage import MemoryStorage, SQLiteStorage
+
+START = datetime(2025, 1, 1)
+
+
+@pytest.fixture
+def backends(tmp_path):
+    """The same random readings loaded into every backend; memory is the reference."""
+    stores = [
+        MemoryStorage(),
+        SQLiteStorage(str(tmp_path / "genset.db")),
+        PartitionedSQLiteStorage(str(tmp_path / "partitions"), period="day"),
+    ]
+    for store in stores:
+        store.init()
+    rng = random.Random(7)
+    readings = [
+        (f"genset-{rng.randint(0, 5)}", START + timedelta(seconds=rng.randint(0, 5 * 86400 - 1)),
+         round(rng.uniform(20, 90), 1), round(rng.uniform(0, 100), 1))
+        for _ in range(2000)
+    ]
+    for store in stores:
+        store.ingest_many(readings)
+    return stores
+
+
+def rounded(value):
+    if isinstance(value, float):
+        return round(value, 6)
+    if isinstance(value, dict):
+        return {k: rounded(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [rounded(v) for v in value]
+    return value
+
+
+def rows(readings):
+    return sorted((r["device_id"], r["timestamp"], r["fuel_level"], r["temperature"]) for r in readings)
+
+
+def test_range_matches_memory(backends):
+    reference, *others = backends
+    start, end = START + timedelta(days=1, hours=6), START + timedelta(days=3, hours=2)
+    expected = rows(reference.range(start=start, end=end, limit=10 ** 6))
+    expected_device = rows(reference.range(device_id="genset-2", limit=10 ** 6))
+    for store in others:
+        assert rows(store.range(start=start, end=end, limit=10 ** 6)) == expected
+        assert rows(store.range(device_id="genset-2", limit=10 ** 6)) == expected_device
+        # Newest first, cut at limit
+        assert [r["timestamp"] for r in store.range(limit=25)] == \
+               [r["timestamp"] for r in reference.range(limit=25)]
+
+
+def test_aggregate_matches_memory(backends):
+    reference, *others = backends
+    start, end = START + timedelta(hours=12), START + timedelta(days=4)
+    expected = rounded(reference.aggregate(start, end))
+    for store in others:
+        assert rounded(store.aggregate(start, end)) == expected
+        assert rounded(store.aggregate(start, device_ids=["genset-1"])) == \
+               rounded(reference.aggregate(start, device_ids=["genset-1"]))
+        assert store.aggregate(start, device_ids=[]) == {}
+
+
+def test_devices_and_fleet_summary_match_memory(backends):
+    reference, *others = backends
+    since = START + timedelta(days=4)
+    for store in others:
+        assert store.devices(limit=2, offset=1) == reference.devices(limit=2, offset=1)
+        assert rounded(store.fleet_summary(since, limit=3)) == rounded(reference.fleet_summary(since, limit=3))
+        assert store.fleet_summary(since, offset=100) == ([], 6)
+        assert store.latest("genset-4") == reference.latest("genset-4")
+
+
+def test_drop_before(backends):
+    cutoff = START + timedelta(days=2)  # a partition boundary, so every backend drops the same rows
+    for store in backends:
+        before = store.data_version()
+        store.drop_before(cutoff)
+        remaining = store.range(limit=10 ** 6)
+        assert remaining and min(r["timestamp"] for r in remaining) >= "2025-01-03 00:00:00"
+        assert store.data_version() != before
+    reference, *others = backends
+    for store in others:
+        assert rows(store.range(limit=10 ** 6)) == rows(reference.range(limit=10 ** 6))
+        assert store.devices() == reference.devices()
+
+
+def test_data_version_changes_for_writes_to_older_partitions(tmp_path):
+    store = PartitionedSQLiteStorage(str(tmp_path), period="day")
+    store.init()
+    store.ingest("genset-1", START + timedelta(days=3), 40.0, 80.0)
+    before = store.data_version()
+    store.ingest_many([("genset-1", START, 41.0, 79.0)])  # a late reading, older partition
+    assert store.data_version() != before
+    unchanged = store.data_version()
+    store.ingest_many([("genset-1", START, 41.0, 79.0)])  # duplicate: nothing stored
+    assert store.data_version() == unchanged
+
+
+def test_partitioned_drop_removes_partition_files(tmp_path):
+    store = PartitionedSQLiteStorage(str(tmp_path), period="day")
+    store.init()
+    store.ingest("genset-1", START, 40.0, 80.0)
+    store.ingest("genset-1", START + timedelta(days=1), 41.0, 79.0)
+    old = store.partitions(newest_first=False)[0]
+    store.drop_before(START + timedelta(days=1))
+    assert not (tmp_path / old.path).exists()
+    assert [p.name for p in store.partitions()] == ["2025-01-02"]
+    assert store.latest("genset-1")["timestamp"] == "2025-01-02 00:00:00"